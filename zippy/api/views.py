@@ -19,7 +19,7 @@ def update_Location2(primername,vessel,well):
     # read config
     with open(app.config['CONFIG_FILE']) as conf:
         config = json.load(conf, object_hook=ascii_encode_dict)
-        db = PrimerDB(config['database'])
+        db = PrimerDB(config['database'], persistent=True)
     # run zippy and render
     updateStatus = updateLocation(primername, Location(vessel, well), db, False)
     return render_template('location_updated.html', status=updateStatus)
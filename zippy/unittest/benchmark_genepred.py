@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+__doc__ == """Benchmark of GenePred loading and tiling (heap exon merge vs baseline quadratic merge)"""
+
+import io, sys, time, random, argparse
+from zippy.zippylib import files
+from zippy.zippylib.files import GenePred
+from .test_genepred import quadraticCombine
+
+# largest refGene genes (exon count, span)
+GENES = {"TTN": (363, 281434), "DMD": (79, 2092328)}
+
+
+"""synthetic GenePred line of a gene with n exons"""
+
+
+def genePredLine(name, n, span, seed=1):
+    random.seed(seed)
+    starts = sorted(random.sample(range(0, span - 400, 400), n))
+    ends = [s + random.choice([50, 100, 150, 300]) for s in starts]
+    fields = ["0", "NM_" + name, "2", "-", "1000", str(1000 + span), "1000", str(1000 + span), str(n),
+              ",".join(str(1000 + s) for s in starts) + ",", ",".join(str(1000 + e) for e in ends) + ",",
+              "0", name, "cmpl", "cmpl", "0"]
+    return "\t".join(fields) + "\n"
+
+
+"""reads GenePred lines of genes from annotation file"""
+
+
+def annotationLines(annotation, genes):
+    lines = {g: "" for g in genes}
+    with open(annotation) as fh:
+        for line in fh:
+            f = line.split("\t")
+            if len(f) > 12 and f[12] in lines:
+                lines[f[12]] += line
+    return lines
+
+
+"""times GenePred parsing, exon merging and tiling (best of repeats)"""
+
+
+def timeGenePred(lines, tiling, repeats):
+    best, genes = None, None
+    for i in range(repeats):
+        t0 = time.time()
+        genes = GenePred(io.StringIO(lines), combine=True, **tiling)
+        best = min(best, time.time() - t0) if best is not None else time.time() - t0
+    return best, sorted((iv.chrom, iv.chromStart, iv.chromEnd, iv.name) for iv in genes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks GenePred loading and tiling of large genes")
+    parser.add_argument("-a", dest="annotation", help="GenePred annotation (refGene) [synthetic genes]")
+    parser.add_argument("-g", dest="genes", nargs="+", default=list(GENES.keys()), help="genes")
+    parser.add_argument("-i", dest="interval", type=int, default=500, help="tiling interval")
+    parser.add_argument("-r", dest="repeats", type=int, default=3, help="repeats")
+    args = parser.parse_args()
+    tiling = {"interval": args.interval, "overlap": 10, "flank": 15}
+    if args.annotation:
+        genes = annotationLines(args.annotation, args.genes)
+    else:
+        genes = {g: genePredLine(g, *GENES[g]) for g in args.genes if g in GENES}
+    heapCombine = files.combineExons
+    results = []
+    for gene, lines in genes.items():
+        if not lines:
+            print("WARNING: {} not found".format(gene), file=sys.stderr)
+            continue
+        files.combineExons = quadraticCombine
+        baseline, expected = timeGenePred(lines, tiling, args.repeats)
+        files.combineExons = heapCombine
+        current, observed = timeGenePred(lines, tiling, args.repeats)
+        assert observed == expected, gene
+        results.append((gene, len(observed), baseline, current))
+    print("{:<10} {:>9} {:>12} {:>12} {:>8}".format("GENE", "INTERVALS", "BASELINE(s)", "HEAP(s)", "SPEEDUP"))
+    for gene, n, baseline, current in results:
+        print("{:<10} {:>9} {:>12.4f} {:>12.4f} {:>7.1f}x".format(gene, n, baseline, current, baseline / current))
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+import sys, subprocess, pytest
+from zippy.zippylib.primer import streamAlignments
+
+header = "@HD\tVN:1.0\n@SQ\tSN:1\tLN:100000\n"
+record = "{}\t0\t1\t{}\t42\t20M\t*\t0\t0\tACGTGACCTGAGTCAGCTAG\t*\tMD:Z:20\n"
+
+
+def aligner(records, exitcode=0, forever=False):
+    # aligner stand-in writing SAM records to stdout
+    script = "import sys\nsys.stdout.write({!r})\n".format(header + "".join(records))
+    if forever:
+        script += "while True:\n    sys.stdout.write({!r})\n".format(record.format("p", 1))
+    script += "sys.stdout.flush()\nsys.exit({})\n".format(exitcode)
+    return [sys.executable, "-c", script]
+
+
+class TestStreamAlignments:
+    def test_placements(self):
+        placements = streamAlignments(aligner([record.format("p", 101)]), lambda x: x, tmThreshold=0)
+        assert [(c, p, r) for c, p, r, tm in placements["p"]] == [("1", 100, False)]
+
+    def test_aligner_failure(self):
+        with pytest.raises(subprocess.CalledProcessError):
+            streamAlignments(aligner([record.format("p", 101)], exitcode=3), lambda x: x, tmThreshold=0)
+
+    def test_original_error(self):
+        def key(name):
+            raise KeyError(name)
+
+        # aligner killed when parsing fails (no CalledProcessError from broken pipe)
+        with pytest.raises(KeyError):
+            streamAlignments(aligner([], forever=True), key, reads=">p\nACGT\n", tmThreshold=0)
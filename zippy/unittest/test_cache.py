@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+import os, pickle, time
+from zippy.zippylib.cache import DesignCache
+
+pars = {"PRIMER_OPT_SIZE": 20, "PRIMER_PRODUCT_SIZE_RANGE": [[150, 250]]}
+
+
+def fill(cache, n, size=2000):
+    keys = []
+    for i in range(n):
+        keys.append(cache.key("ACGT" * 50, [[i, 10]], pars))
+        cache.put(keys[-1], {"PRIMER_PAIR_NUM_RETURNED": i, "PAD": "N" * size})
+        os.utime(cache._file(keys[-1]), (time.time() - n + i,) * 2)  # distinct ages
+    return keys
+
+
+class TestDesignCache:
+    def test_key(self, tmp_path):
+        cache = DesignCache(str(tmp_path))
+        key = cache.key("ACGT", [[1, 2]], pars)
+        assert key == cache.key("ACGT", [[1, 2]], dict(reversed(list(pars.items()))))
+        assert len(key) == 40 and key != cache.key("ACGT", [[1, 3]], pars)
+        assert key != cache.key("ACGT", [[1, 2]], dict(pars, PRIMER_OPT_SIZE=21))
+
+    def test_roundtrip(self, tmp_path):
+        cache = DesignCache(str(tmp_path))
+        key = cache.key("ACGT", [[1, 2]], pars)
+        assert cache.get(key) is None
+        cache.put(key, {"PRIMER_LEFT_0_SEQUENCE": "ACGT"})
+        assert cache.get(key) == {"PRIMER_LEFT_0_SEQUENCE": "ACGT"}
+        cache.tally(True)
+        cache.tally(False)
+        cache.tally(True)
+        assert (cache.hits, cache.misses) == (2, 1) and "66.7%" in str(cache)
+
+    def test_eviction(self, tmp_path):
+        cache = DesignCache(str(tmp_path), maxsize=20000 / 2 ** 20)
+        keys = fill(cache, 20)
+        remaining = [k for k in keys if os.path.exists(cache._file(k))]
+        assert remaining == keys[-len(remaining):]  # oldest evicted first
+        assert sum(os.path.getsize(cache._file(k)) for k in remaining) <= 20000
+        assert cache.size == sum(e[1] for e in cache._entries())
+
+    def test_worker(self, tmp_path):
+        cache = DesignCache(str(tmp_path), maxsize=20000 / 2 ** 20)
+        worker = pickle.loads(pickle.dumps(cache))
+        keys = fill(worker, 20)
+        assert worker.worker and not cache.worker
+        assert all(os.path.exists(worker._file(k)) for k in keys)  # no eviction in workers
+        cache.refresh()
+        assert 0 < cache.size <= 20000 and not os.path.exists(cache._file(keys[0]))
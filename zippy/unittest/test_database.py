@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import pytest
+from zippy.zippylib import database
+from zippy.zippylib.database import PrimerDB
+from zippy.zippylib.interval import Interval
+from zippy.zippylib.primer import Primer, PrimerPair, Locus
+
+
+def pair(name, offset, chrom="1"):
+    left = Primer(name + "_fwd", "ACGTGACCTGAGTCAGCTAG", Locus(chrom, offset, 20, False, 60.0))
+    right = Primer(name + "_rev", "TTGCAGCTAGCATCGACTGA", Locus(chrom, offset + 200, 20, True, 60.0))
+    return PrimerPair([left, right], name=name)
+
+
+@pytest.fixture(params=[False, True], ids=["connect", "persistent"])
+def db(request, tmp_path):
+    db = PrimerDB(str(tmp_path / "zippy.sqlite"), persistent=request.param)
+    yield db
+    database.closeConnections()
+
+
+class TestPrimerDB:
+    def test_store_and_query(self, db):
+        db.addPair(pair("GENE_1", 1000))
+        pairs, messages = db.query(Interval("1", 1050, 1150))
+        assert [p.name for p in pairs] == ["GENE_1"]
+        assert [p.name for p in db.query("GENE")[0]] == ["GENE_1"]
+
+    def test_persistent_connection(self, db):
+        db.query("GENE")
+        assert (db.connect() is db.connect()) == db.persistent
+
+    def test_transaction(self, db):
+        with db:
+            db.addPair(pair("GENE_1", 1000))
+            db.addPair(pair("GENE_2", 5000))
+        assert len(db.query("GENE")[0]) == 2
+        with pytest.raises(ValueError):
+            with db:
+                db.addPair(pair("GENE_3", 9000))
+                raise ValueError
+        assert [p.name for p in db.query("GENE")[0]] == ["GENE_1", "GENE_2"]
+
+    def test_interval_index(self, db, tmp_path):
+        assert db.rtree
+        for i in range(20):
+            db.addPair(pair("GENE_{}".format(i), 1000 + 100 * i))
+        db.updateName("GENE_3_fwd", "GENE_3_left")
+        queries = [Interval("1", s, s + w) for s in range(900, 3400, 70) for w in (1, 50, 150)]
+        expected = [[p.name for p in db.query(q)[0]] for q in queries]
+        db.rtree = False  # exact query without interval index
+        assert [[p.name for p in db.query(q)[0]] for q in queries] == expected
+        assert any(expected) and "GENE_3" in sum(expected, [])
+
+    def test_interval_index_upgrade(self, db):
+        db.addPair(pair("GENE_1", 1000))
+        conn = db.connect()
+        conn.execute("DROP TABLE pairs_rtree")
+        conn.commit()
+        db.release()
+        upgraded = PrimerDB(db.sqlite, persistent=db.persistent)
+        assert [p.name for p in upgraded.query(Interval("1", 1050, 1150))[0]] == ["GENE_1"]
+
+    def test_interval_index_renumbered(self, db):
+        db.addPair(*[pair("GENE_{}".format(i), 1000 + 1000 * i) for i in range(10)])
+        conn = db.connect()
+        conn.execute("DELETE FROM pairs WHERE pairid = 'GENE_1'")
+        conn.execute("UPDATE pairs SET rowid = rowid + 100")  # implicit rowids may change (VACUUM)
+        conn.commit()
+        db.release()
+        found = [[p.name for p in db.query(Interval("1", s + 50, s + 150))[0]] for s in range(1000, 11000, 1000)]
+        assert found == [["GENE_{}".format(i)] if i != 1 else [] for i in range(10)]
+
+    def test_interval_index_chromosomes(self, db):
+        db.addPair(pair("GENE_1", 1000, "1"), pair("GENE_2", 1000, "2"), pair("GENE_X", 1100, "X"))
+        found = [[p.name for p in db.query(Interval(c, 1150, 1180))[0]] for c in ["1", "2", "X", "Y"]]
+        assert found == [["GENE_1"], ["GENE_2"], ["GENE_X"], []]
+        conn = db.connect()
+        assert conn.execute("SELECT count(DISTINCT minchrom) FROM pairs_rtree").fetchone()[0] == 3
+        db.release()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+import json
+from zippy import zippy
+from zippy.zippylib.database import PrimerDB
+from zippy.zippylib.interval import Interval, IntervalIndex
+from zippy.zippylib.primer import Aligner, Locus, Primer, PrimerPair
+
+
+def designed(name="G"):
+    left = Primer(name + "_0_LEFT", "ACGTGACCTGAGTCAGCTAG")
+    left.meta = {"POSITION": ("1", 1000, 1020)}
+    right = Primer(name + "_0_RIGHT", "TTGCAGCTAGCATCGACTGA")
+    right.meta = {"POSITION": ("1", 1181, 1200)}
+    return {Interval("1", 1020, 1181, name): [PrimerPair([left, right])]}
+
+
+def stored(name, offset):
+    left = Primer(name + "_fwd", "ACGTGACCTGAGTCAGCTAG", Locus("1", offset, 20, False, 60.0))
+    right = Primer(name + "_rev", "TTGCAGCTAGCATCGACTGA", Locus("1", offset + 200, 20, True, 60.0))
+    return PrimerPair([left, right], name=name)
+
+
+class TestImportDesignedPairs:
+    def test_uniqueid(self):
+        aligner = Aligner("genome")
+        aligner.preload({"ACGTGACCTGAGTCAGCTAG": [], "TTGCAGCTAGCATCGACTGA": []})
+        pairs = zippy.importDesignedPairs(designed(), aligner)
+        assert [(p.name, p.tag) for p in pairs[0]] == [("G_fwd", None), ("G_rev", None)]
+        # uniqueid of same pair imported from FASTA by importPrimerPairs (blacklist key)
+        assert pairs[0].uniqueid() == "3782b9024f41462e10a618e0d8ffdf50bcfb4509"
+
+
+class TestChunkedQuery:
+    def test_chunks(self, tmp_path, monkeypatch):
+        with open("zippy/zippy.json") as fh:
+            config = json.load(fh)
+        config["blacklistcache"] = str(tmp_path / "blacklist.pickle")
+        config.pop("cache", None)
+        monkeypatch.setattr(zippy, "gplist", IntervalIndex([]))
+        db = PrimerDB(str(tmp_path / "zippy.sqlite"))
+        db.addPair(*[stored("GENE_{}".format(i), 1000 * (i + 1)) for i in range(5)])
+        targets = str(tmp_path / "targets.bed")
+        with open(targets, "w") as fh:
+            # unsorted, duplicate names, equal coordinates, same pair in several chunks, missed target
+            for start, end, name in [(4050, 4100, "T"), (1050, 1150, "A"), (5060, 5100, "B"),
+                                     (1060, 1100, "T"), (3050, 3150, "A"), (2050, 2150, "D"),
+                                     (2050, 2150, "C"), (9050, 9150, "M"), (4050, 4100, "Z")]:
+                fh.write("1\t{}\t{}\t{}\n".format(start, end, name))
+        blacklists, readBlacklist = [], zippy.readBlacklist
+
+        def countedBlacklist(*args):
+            blacklists.append(readBlacklist(*args))
+            return blacklists[-1]
+
+        monkeypatch.setattr(zippy, "readBlacklist", countedBlacklist)
+        results = []
+        for chunksize in [0, 2]:
+            config["design"]["chunksize"] = chunksize
+            primerTable, resultList, missed, messages = zippy.zippyPrimerQuery(
+                config, targets, design=False, db=db
+            )
+            results.append(
+                (
+                    primerTable,
+                    [(str(p), [str(iv) for iv in p.variants]) for p in resultList],
+                    [str(iv) for iv in missed],
+                )
+            )
+        assert results[0] == results[1]
+        assert [row[0] for row in results[0][0]] == ["A-01", "T-02", "C", "D", "A-02", "T-01", "Z", "B"]
+        assert len(results[0][1][0][1]) == 2  # pair covers targets of different chunks
+        assert len(blacklists) == 2  # read once per query (shared by chunks)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import io, random
+from zippy.zippylib.files import GenePred, combineExons
+from zippy.zippylib.interval import Interval
+
+
+def quadraticCombine(exons, interval):
+    # previous implementation (reference)
+    combinedExons = [[x] for x in exons]
+    while True:
+        distances = [
+            max([x.chromEnd for x in combinedExons[i]])
+            - min([x.chromStart for x in combinedExons[i - 1]])
+            for i in range(1, len(combinedExons))
+        ]
+        if any([d < interval for d in distances]):
+            smallestIndex = distances.index(min(distances))
+            combinedExons[smallestIndex] += combinedExons.pop(smallestIndex + 1)
+        else:
+            return combinedExons
+
+
+def randomGene(n, seed):
+    random.seed(seed)
+    exons, pos = [], 0
+    for i in range(n):
+        pos += random.choice([1, 50, 100, 200, 500, 2000])  # many ties
+        length = random.choice([50, 100, 150, 300])
+        exons.append(Interval("2", pos, pos + length, "TTN"))
+        pos += length
+    return exons
+
+
+class TestCombineExons:
+    def test_reference(self):
+        for seed in range(50):
+            exons = randomGene(random.randint(0, 60), seed)
+            for interval in [100, 500, 1000, 5000]:
+                assert [[str(e) for e in g] for g in combineExons(exons, interval)] == [
+                    [str(e) for e in g] for g in quadraticCombine(exons, interval)
+                ]
+
+    def test_exon_numbers(self):
+        genepred = "\t".join(
+            ["0", "NM_1.1", "1", "-", "1000", "5000", "1000", "5000", "4",
+             "1000,1300,1500,4000,", "1100,1400,1600,4100,", "0", "GENE", "cmpl", "cmpl", "0"]
+        )
+        genes = GenePred(io.StringIO(genepred + "\n"), interval=1000, overlap=10, combine=True)
+        assert sorted((iv.name, iv.chromStart, iv.chromEnd) for iv in genes) == [
+            ("GENE_1", 4000, 4100),
+            ("GENE_4,3,2", 1000, 1600),
+        ]
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+import os
+import pysam
+import pytest
+from zippy.zippylib import files, gnomad
+
+
+def writeSource(chromobj, n=50, af=0.01):
+    text = chromobj.file_fullpath[: -len(".bgz")]
+    with open(text, "w") as fh:
+        fh.write('##fileformat=VCFv4.2\n##contig=<ID={},length=100000>\n'.format(chromobj.chromosome_id))
+        fh.write('##INFO=<ID=AF,Number=A,Type=Float,Description="Allele frequency">\n')
+        fh.write('##INFO=<ID=AC,Number=A,Type=Integer,Description="Allele count">\n')
+        fh.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+        for i in range(n):
+            fh.write("{}\t{}\trs{}\tA\tG\t.\tPASS\tAC=3;AF={}\n".format(chromobj.chromosome_id, 1000 + 10 * i, i, af))
+    pysam.tabix_compress(text, chromobj.file_fullpath, force=True)
+    pysam.tabix_index(chromobj.file_fullpath, preset="vcf", force=True)
+    os.remove(text)
+
+
+def stripped(chromobj):
+    with pysam.VariantFile(chromobj.stripped_file_fullpath) as vcf:
+        return [(rec.pos, dict(rec.info)) for rec in vcf.fetch(chromobj.chromosome_id)]
+
+
+@pytest.fixture
+def chromosomes(tmp_path):
+    chromosomes_infos = {}
+    for chrom in ["21", "22"]:
+        chromosomes_infos[chrom] = gnomad.GnomadChromosomeInfo("2.1.1", "genomes", chrom, str(tmp_path))
+        writeSource(chromosomes_infos[chrom])
+    return chromosomes_infos
+
+
+class TestStrip:
+    def test_checkpoint(self, chromosomes):
+        chromobj = chromosomes["21"]
+        assert chromobj.strip_data() is True
+        records = stripped(chromobj)
+        assert len(records) == 50 and records[0][0] == 1000
+        assert all(list(info) == ["AF"] and info["AF"][0] == pytest.approx(0.01) for pos, info in records)
+        mtime = os.stat(chromobj.stripped_file_fullpath).st_mtime_ns
+        assert chromobj.strip_data() is False  # resumed from checkpoint
+        assert os.stat(chromobj.stripped_file_fullpath).st_mtime_ns == mtime
+
+    def test_changed_source(self, chromosomes):
+        chromobj = chromosomes["21"]
+        chromobj.strip_data()
+        writeSource(chromobj, n=20, af=0.5)
+        assert not chromobj.is_stripped()
+        assert chromobj.strip_data() is True
+        assert stripped(chromobj) == [(1000 + 10 * i, {"AF": (0.5,)}) for i in range(20)]
+
+    def test_failure(self, chromosomes, monkeypatch):
+        chromobj = chromosomes["21"]
+        chromobj.strip_data()
+        writeSource(chromobj, n=20, af=0.5)
+        create = files.VCF.create_stripped_vcf
+
+        def interrupted(source, target, threads=1):
+            create(source, target, threads)
+            raise KeyboardInterrupt
+
+        monkeypatch.setattr(files.VCF, "create_stripped_vcf", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            chromobj.strip_data()
+        assert not [f for f in os.listdir(chromobj.resources_folder) if ".partial." in f]
+        assert len(stripped(chromobj)) == 50 and not chromobj.is_stripped()  # previous output kept
+        monkeypatch.undo()
+        assert chromobj.strip_data() is True and len(stripped(chromobj)) == 20
+
+    def test_strip_files(self, chromosomes):
+        gnomad.strip_files(chromosomes, processes=2)
+        assert all(c.is_stripped() for c in chromosomes.values())
+        mtimes = [os.stat(c.stripped_file_fullpath).st_mtime_ns for c in chromosomes.values()]
+        gnomad.strip_files(chromosomes, processes=2)
+        assert [os.stat(c.stripped_file_fullpath).st_mtime_ns for c in chromosomes.values()] == mtimes
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+import os
+import pytest
+import pysam
+import multiprocessing
+from zippy.zippylib import database, handles
+from zippy.zippylib.database import PrimerDB
+from zippy.zippylib.interval import Interval
+from .test_database import pair
+
+
+def writeFasta(path, seq):
+    with open(path, "w") as fh:
+        fh.write(">1\n{}\n".format(seq))
+    pysam.faidx(path)
+    return path
+
+
+class TestHandleRegistry:
+    def test_reuse(self, tmp_path, monkeypatch):
+        fasta = writeFasta(str(tmp_path / "ref.fa"), "ACGT" * 25)
+        registry = handles.HandleRegistry(pysam.FastaFile)
+        handle = registry.get(fasta)
+        monkeypatch.setattr(os, "stat", None)  # no stat of cached handles
+        assert registry.get(fasta) is handle and len(registry) == 1
+        assert registry.get(fasta).fetch("1", 0, 8) == "ACGTACGT"
+        monkeypatch.undo()
+        registry.refresh()
+        assert registry.get(fasta) is handle  # unchanged file
+        registry.close()
+        assert len(registry) == 0
+
+    def test_reopen(self, tmp_path):
+        fasta = writeFasta(str(tmp_path / "ref.fa"), "ACGT" * 25)
+        registry = handles.HandleRegistry(pysam.FastaFile)
+        handle = registry.get(fasta)
+        writeFasta(fasta, "TTGCA" * 30)
+        assert registry.get(fasta) is handle  # kept until refresh
+        registry.refresh()
+        assert registry.get(fasta) is not handle
+        assert registry.get(fasta).fetch("1", 0, 8) == "TTGCATTG"
+        os.unlink(fasta)
+        registry.refresh()  # removed files are released
+        assert len(registry) == 0
+
+
+def childState(fasta, db):
+    # runs in forked child
+    inherited = len(handles.fastafiles)
+    seq = handles.fastaFile(fasta).fetch("1", 4, 12)
+    pairs = [p.name for p in db.query(Interval("1", 1050, 1150))[0]]
+    keys = sorted(k[1] == os.getpid() for k in database.connections)
+    database.closeConnections()
+    return inherited, seq, pairs, keys
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="requires fork")
+class TestFork:
+    def test_child(self, tmp_path):
+        fasta = writeFasta(str(tmp_path / "ref.fa"), "ACGTTGCA" * 20)
+        db = PrimerDB(str(tmp_path / "zippy.sqlite"), persistent=True)
+        db.addPair(pair("GENE_1", 1000))
+        handle = handles.fastaFile(fasta)
+        connection = db.connect()
+        try:
+            with multiprocessing.get_context("fork").Pool(1) as pool:
+                inherited, seq, pairs, keys = pool.apply(childState, (fasta, db))
+            assert inherited == 0  # parent handles dropped in child
+            assert seq == "TGCAACGT" and pairs == ["GENE_1"]
+            assert keys == [False, True]  # own connection next to inherited parent connection
+            # parent handle and connection unaffected by child
+            assert handles.fastaFile(fasta) is handle and handle.fetch("1", 0, 4) == "ACGT"
+            assert db.connect() is connection
+            assert [p.name for p in db.query(Interval("1", 1050, 1150))[0]] == ["GENE_1"]
+        finally:
+            handles.fastafiles.release(fasta)
+            database.closeConnections()
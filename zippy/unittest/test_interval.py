@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import pickle, random
+from zippy.zippylib.interval import (
+    Interval,
+    IntervalArray,
+    IntervalIndex,
+    IntervalStore,
+    intersectIntervals,
+)
+
+
+def bruteforce(intervals, chrom, start, end):
+    query = Interval(chrom, start, end)
+    return [iv for iv in intervals if iv.overlap(query)]
+
+
+class TestIntervalIndex:
+    def test_overlapping(self):
+        random.seed(7)
+        intervals = []
+        for i in range(500):
+            start = random.randint(0, 100000)
+            intervals.append(Interval(random.choice("12X"), start, start + random.randint(0, 2000)))
+        index = IntervalIndex(intervals)
+        for i in range(500):
+            chrom, start = random.choice("12XY"), random.randint(0, 100000)
+            end = start + random.randint(0, 500)
+            assert index.overlapping(chrom, start, end) == bruteforce(intervals, chrom, start, end)
+
+    def test_bookended(self):
+        index = IntervalIndex([Interval("1", 100, 200, "a"), Interval("1", 300, 400, "b")])
+        assert [iv.name for iv in index.overlapping("1", 200, 300)] == ["a", "b"]
+        assert index.overlapping("1", 201, 299) == []
+        assert index.overlapping("2", 100, 200) == []
+
+    def test_first(self):
+        intervals = [Interval("1", 500, 600, "a"), Interval("1", 100, 200, "b")]
+        index = IntervalIndex(intervals)
+        assert index.first([Interval("1", 150, 160), Interval("1", 550, 560)]).name == "a"
+        assert index.first([Interval("1", 150, 160)]).name == "b"
+        assert index.first([Interval("2", 150, 160)]) is None
+
+
+class TestIntervalStore:
+    def test_same_as_index(self, tmp_path):
+        random.seed(11)
+        intervals = []
+        for i in range(300):
+            start = random.randint(0, 50000)
+            intervals.append(
+                Interval(random.choice(["1", "2", "10"]), start, start + random.randint(0, 800),
+                         "GENE{}_{}".format(i % 40, i), random.choice([None, True, False]))
+            )
+        IntervalStore.write(str(tmp_path / "store.npy"), intervals)
+        store, index = IntervalStore(str(tmp_path / "store.npy")), IntervalIndex(intervals)
+        assert len(store) == len(index)
+        assert [(str(a), a.strand) for a in store] == [(str(b), b.strand) for b in intervals]
+        for i in range(300):
+            chrom, start = random.choice(["1", "2", "10", "X"]), random.randint(0, 50000)
+            assert list(map(str, store.overlapping(chrom, start, start + 100))) == list(
+                map(str, index.overlapping(chrom, start, start + 100))
+            )
+        queries = [Interval("2", 100, 30000), Interval("1", 20000, 20100)]
+        assert str(store.first(queries)) == str(index.first(queries))
+
+
+class TestInterval:
+    def test_key(self):
+        a, b = Interval("1", 100, 200, "A"), Interval("1", 100, 200, "A", reverse=True)
+        assert a == b and hash(a) == hash(b)
+        assert a != Interval("1", 100, 200, "B") and a != "1\t100\t200\tA"
+        assert {a: 1}[b] == 1
+
+    def test_lazy_attributes(self):
+        iv = Interval("1", 100, 200, metadata="AF=0.1;DB;DP=7")
+        assert not hasattr(iv, "__dict__")
+        assert iv.metadata == ["AF=0.1", "DB", "DP=7"]
+        assert iv.metadata_dict == {"AF": "0.1", "DP": "7"}
+        assert Interval("1", 100, 200).metadata is None
+        iv.addSubintervals([Interval("1", 50, 120)])
+        assert (iv.chromStart, len(iv.subintervals)) == (50, 1)
+
+    def test_pickle(self):
+        iv = Interval("1", 100, 200, "A", reverse=False, sample="S1")
+        iv.addSubintervals([Interval("1", 120, 150, "A")])
+        copy = pickle.loads(pickle.dumps(iv))
+        assert copy == iv and copy.strand == 1 and copy.sample == "S1"
+        assert copy.subintervals == iv.subintervals
+
+
+class TestIntervalArray:
+    def intervals(self, n):
+        random.seed(n)
+        intervals = []
+        for i in range(n):
+            start = random.randint(0, 100000)
+            intervals.append(
+                Interval(random.choice("12X"), start, start + random.randint(0, 3000),
+                         random.choice([None, "E{}".format(i)]), random.choice([None, True, False]))
+            )
+        return intervals
+
+    def fields(self, intervals):
+        return [(x.chrom, x.chromStart, x.chromEnd, x.name, x.strand) for x in intervals]
+
+    def test_tile_extend(self):
+        intervals = self.intervals(200)
+        for i, o, suffix in [(500, 10, True), (1000, 0, False), (101, 25, True)]:
+            tiles = []
+            for iv in intervals:
+                tiles += iv.tile(i, o, suffix) if i < len(iv) else [iv]
+            array = IntervalArray.fromIntervals(intervals).tile(i, o, suffix).extend(15)
+            assert self.fields(array.toIntervals()) == self.fields([iv.extend(15) for iv in tiles])
+
+    def test_overlaps(self):
+        a, b = self.intervals(150), self.intervals(80)
+        i, j = IntervalArray.fromIntervals(a).overlaps(IntervalArray.fromIntervals(b))
+        expected = [(x, y) for x in range(len(a)) for y in range(len(b)) if a[x].overlap(b[y])]
+        assert list(zip(i.tolist(), j.tolist())) == expected
+
+
+class TestIntersectIntervals:
+    def test_narrowed_to_loci(self):
+        loci = [Interval("1", 1000, 2000), Interval("1", 1500, 5000), Interval("2", 0, 100)]
+        intervals = [Interval("1", 900, 1600), Interval("1", 4000, 6000), Interval("2", 200, 300)]
+        intersected = intersectIntervals(loci, intervals)
+        assert [(iv.chromStart, iv.chromEnd, iv.name) for iv in intersected] == [
+            (1500, 1600, "1:1500-1600"),  # narrowed by both loci
+            (1500, 1600, "1:1500-1600"),
+            (4000, 5000, "1:4000-5000"),
+        ]
+        assert intersected[0] is intersected[1] is intervals[0]
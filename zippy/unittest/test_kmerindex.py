@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+import random, pysam, pytest
+from zippy.zippylib import ConfigError
+from zippy.zippylib.kmerindex import buildIndex, KmerAligner
+
+revcmp = str.maketrans("ACGT", "TGCA")
+
+
+def mutate(seq, i):
+    return seq[:i] + ("A" if seq[i] != "A" else "C") + seq[i + 1:]
+
+
+@pytest.fixture(scope="module")
+def genome(tmp_path_factory):
+    random.seed(42)
+    chroms = {c: "".join(random.choice("ACGT") for _ in range(5000)) for c in ["1", "2"]}
+    path = tmp_path_factory.mktemp("kmer")
+    with open(path / "genome.fa", "w") as fh:
+        for c, s in chroms.items():
+            fh.write(">{}\n{}\n".format(c, s))
+    pysam.faidx(str(path / "genome.fa"))
+    index = buildIndex(str(path / "genome.fa"), str(path / "genome.kmer"), k=8, chunksize=1000)
+    return chroms, index
+
+
+class TestKmerIndex:
+    def test_exact_sites(self, genome):
+        chroms, index = genome
+        sites = index.sites(chroms["2"][1234:1254])
+        assert sites[0][:4] == (0, 1, 1234, False)
+
+    def test_reverse_strand(self, genome):
+        chroms, index = genome
+        seq = chroms["1"][300:322].translate(revcmp)[::-1]
+        sites = index.sites(seq)
+        assert sites[0][:4] == (0, 0, 300, True)
+        assert sites[0][4] == chroms["1"][300:322]
+
+    def test_mismatches(self, genome):
+        chroms, index = genome
+        seq = chroms["1"][2000:2016]
+        assert [s[:3] for s in index.sites(mutate(seq, 7))] == [(1, 0, 2000)]
+        assert [s[:3] for s in index.sites(mutate(mutate(seq, 2), 12))] == []
+
+    def test_chromosome_boundary(self, genome):
+        chroms, index = genome
+        assert index.sites(chroms["1"][-10:] + chroms["2"][:10]) == []
+
+    def test_placement_rules(self, genome):
+        chroms, index = genome
+        seq = chroms["1"][4000:4022]
+        placements = index.place(seq, tmThreshold=30.0, endMatch=6)
+        assert [(c, p, r) for c, p, r, tm in placements] == [("1", 4000, False)]
+        assert index.place(mutate(seq, 20), tmThreshold=30.0, endMatch=6) == []  # 3' mismatch
+        assert index.place(seq, tmThreshold=30.0, endMatch=6, maxAln=1) == []  # non-specific
+
+    def test_short_queries(self, genome):
+        chroms, index = genome
+        seq = chroms["2"][600:615]  # < 2k, a mismatch can hit both seeds
+        with pytest.raises(ValueError):
+            index.sites(mutate(seq, 4))
+        assert KmerAligner(index.path, minLength=16).index.k == 8
+        with pytest.raises(ConfigError):
+            KmerAligner(index.path, minLength=15)
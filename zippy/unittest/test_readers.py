@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+import os
+from zippy.zippylib.files import BED, VCF, iterBED, iterVCF, iterTargets
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+tiling = {"interval": 200, "overlap": 10, "flank": 15}
+
+
+def fields(intervals):
+    return sorted((iv.chrom, iv.chromStart, iv.chromEnd, iv.name, iv.strand) for iv in intervals)
+
+
+class TestStreamingReaders:
+    def test_bed(self):
+        with open(os.path.join(DATA, "test.bed")) as fh:
+            bed = BED(fh, **tiling)
+        assert fields(iterBED(os.path.join(DATA, "test.bed"), **tiling)) == fields(bed)
+
+    def test_bed_duplicate_names(self, tmp_path):
+        fi = str(tmp_path / "dup.bed")
+        with open(fi, "w") as fh:
+            fh.write("1\t100\t200\tA\n1\t300\t400\tA\n1\t500\t600\tB\n")
+        assert [iv.name for iv in iterBED(fi)] == ["A-01", "A-02", "B"]
+
+    def test_vcf(self):
+        with open(os.path.join(DATA, "test.vcf")) as fh:
+            vcf = VCF(fh, **tiling)
+        streamed = list(iterVCF(os.path.join(DATA, "test.vcf"), **tiling))
+        assert [(repr(iv), iv.metadata) for iv in streamed] == [(repr(iv), iv.metadata) for iv in vcf]
+
+    def test_chunks(self):
+        chunks = list(iterTargets(os.path.join(DATA, "test.vcf"), tiling, chunksize=5))
+        assert all(len(chunk) == 5 for chunk in chunks[:-1]) and 0 < len(chunks[-1]) <= 5
+        with open(os.path.join(DATA, "test.vcf")) as fh:
+            assert sum(map(len, chunks)) == len(VCF(fh, **tiling))
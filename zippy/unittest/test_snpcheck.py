@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+import random
+import pysam
+from zippy.zippylib import snpindex
+from zippy.zippylib.primer import Locus, sweepSnps, snpAnnotation
+
+
+def writeVCF(path, n=600, seed=1):
+    random.seed(seed)
+    with open(path, "w") as fh:
+        fh.write("##fileformat=VCFv4.2\n##contig=<ID=1,length=100000>\n##contig=<ID=2,length=100000>\n")
+        fh.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+        for chrom in ["1", "2"]:
+            pos = 10000
+            for i in range(n):
+                pos += random.choice([0, 1, 3, 10, 40])
+                ref = "".join(random.choice("ACGT") for _ in range(random.choice([1, 1, 2, 5, 10])))
+                alt = random.choice(["A", "AT", "ACGTA", "<DEL>"])
+                info = ["AF={:.3f}".format(random.random() / 20)]
+                if random.random() < 0.3:  # END before, within or after REF span
+                    info.insert(0, "END={}".format(pos + random.randint(-3, 30)))
+                fh.write("\t".join([chrom, str(pos), "rs{}{}".format(chrom, i), ref, alt, ".", "PASS", ";".join(info)]) + "\n")
+    return pysam.tabix_index(path, preset="vcf", force=True)
+
+
+def randomLoci(n=500, seed=2):
+    random.seed(seed)
+    return [
+        Locus(random.choice(["1", "2"]), random.randint(9900, 22000), random.randint(18, 30), False, 60.0)
+        for i in range(n)
+    ]
+
+
+class TestSnpSweep:
+    def test_sweep(self, tmp_path):
+        vcf = writeVCF(str(tmp_path / "snps.vcf"))
+        loci = randomLoci() + [Locus("1", 15714, 22, False, 60.0)]
+        for AF_cutoff in [None, 1.0]:
+            swept = sweepSnps(vcf, loci, AF_cutoff)
+            assert all(swept[l] == l.snpCheck(vcf, AF_cutoff) for l in loci)
+        assert sum(len(swept[l][0]) for l in loci) > 0
+
+    def test_end_before_ref_span(self, tmp_path):
+        vcf = str(tmp_path / "end.vcf")
+        with open(vcf, "w") as fh:
+            fh.write("##fileformat=VCFv4.2\n##contig=<ID=1,length=100000>\n")
+            fh.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+            fh.write("1\t15706\trs1\tACGTACGTAC\tA\t.\tPASS\tEND=15710;AF=0.1\n")
+        vcf = pysam.tabix_index(vcf, preset="vcf", force=True)
+        locus = Locus("1", 15714, 22, False, 60.0)
+        assert sweepSnps(vcf, [locus])[locus] == locus.snpCheck(vcf) == [("1", -9, 10, "rs1")]
+
+    def test_annotation(self, tmp_path):
+        vcf = writeVCF(str(tmp_path / "snps.vcf"))
+        config = {"snpcheck": {"used": ["common"], "common": vcf}}
+        loci = randomLoci()
+        annotation = snpAnnotation(config, loci)
+        assert all(annotation[(vcf, None)][l] == l.snpCheck(vcf) for l in loci)
+
+
+class TestSnpIndex:
+    def test_index(self, tmp_path):
+        vcf = writeVCF(str(tmp_path / "snps.vcf"), n=1500)
+        loci = randomLoci(2000) + [Locus("1", 15714, 22, False, 60.0), Locus("3", 100, 20, False, 60.0)]
+        tabix = {AF_cutoff: [l.snpCheck(vcf, AF_cutoff) for l in loci] for AF_cutoff in [None, 1.0]}
+        index = snpindex.buildIndex(vcf)
+        assert snpindex.snpIndex(vcf) is not None
+        for AF_cutoff, expected in tabix.items():
+            assert [index.snpCheck(l, AF_cutoff) for l in loci] == expected
+
+    def test_outdated(self, tmp_path, monkeypatch):
+        vcf = writeVCF(str(tmp_path / "snps.vcf"), n=10)
+        snpindex.buildIndex(vcf)
+        monkeypatch.setattr(snpindex, "INDEXVERSION", snpindex.INDEXVERSION + 1)
+        snpindex.indexes.clear()
+        assert snpindex.snpIndex(vcf) is None  # tabix until rebuilt
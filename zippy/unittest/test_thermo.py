@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+import primer3
+from zippy.zippylib import thermo
+
+
+class TestThermo:
+    def setup_method(self):
+        thermo.configure(4)
+
+    def teardown_method(self):
+        thermo.configure()
+
+    def test_memo(self):
+        seqs = ["ACGTGCTAGCTAGCTAGGCT", "TTGACCGATGCATGCAAGTC"]
+        for i in range(3):
+            assert thermo.calcTm(seqs[0]) == primer3.calcTm(seqs[0])
+            assert thermo.calcHeterodimerTm(*seqs) == primer3.calcHeterodimerTm(*seqs)
+        stats = thermo.stats()
+        assert (stats["tm"]["calls"], stats["tm"]["hits"], stats["tm"]["size"]) == (3, 2, 1)
+        assert stats["heterodimer"]["hits"] == 2 and set(stats) == {"tm", "heterodimer"}
+
+    def test_configure(self):
+        for n in range(10):
+            thermo.calcTm("ACGTACGTAC" + "A" * n)
+        assert thermo.stats()["tm"]["size"] == 4  # bounded
+        memo = thermo.memos["tm"]
+        thermo.configure(4)
+        assert thermo.memos["tm"] is memo  # same size keeps warm memo
+        thermo.configure(8)
+        assert thermo.stats()["tm"] == {"calls": 0, "hits": 0, "hitrate": 0.0, "size": 0, "maxsize": 8}
+
+    def test_report(self):
+        assert thermo.report() == ""  # unused memos not reported
+        thermo.calcTm("ACGTGCTAGCTAGCTAGGCT")
+        thermo.calcTm("ACGTGCTAGCTAGCTAGGCT")
+        report = thermo.report().splitlines()
+        assert len(report) == 1 and report[0].split()[:4] == ["tm", "2", "calls", "50.0%"]
+        assert report[0].endswith("(1/4 cached)")
@@ -115,7 +115,7 @@ def upload():
         # open config file and database
         with open(app.config['CONFIG_FILE']) as conf:
             config = json.load(conf)
-            db = PrimerDB(config['database'], dump=config['ampliconbed'])
+            db = PrimerDB(config['database'], dump=config['ampliconbed'], persistent=True)
 
         # create output folder
         filehash = hashlib.sha1(b''.join([open(uf,"rb").read() for uf in uploadedFiles])).hexdigest()
@@ -147,7 +147,7 @@ def testpage():
 
 @app.route('/save_comments/', methods=['POST'])
 def search_by_name_comments_save():
-    db = PrimerDB(config['database'], dump=config['ampliconbed'])
+    db = PrimerDB(config['database'], dump=config['ampliconbed'], persistent=True)
     try:
         db.updatePrimerPairsComments(request.form)
     except:
@@ -196,7 +196,7 @@ def adhocdesign():
         # read config
         with open(app.config['CONFIG_FILE']) as conf:
             config = json.load(conf)
-            db = PrimerDB(config['database'],dump=config['ampliconbed'])
+            db = PrimerDB(config['database'], dump=config['ampliconbed'], persistent=True)
         # run Zippy
         """import cProfile
         profiler = cProfile.Profile()
@@ -234,7 +234,7 @@ def updatePrimerLocation():
     # read config
     with open(app.config['CONFIG_FILE']) as conf:
         config = json.load(conf)
-        db = PrimerDB(config['database'],dump=config['ampliconbed'])
+        db = PrimerDB(config['database'], dump=config['ampliconbed'], persistent=True)
     # run zippy and render
     updateStatus = updateLocation(primername, loc, db, force)
     return render_template('location_updated.html', status=updateStatus)
@@ -253,7 +253,7 @@ def update_pair_name(pairName):
         return render_template('update_pair.html', pairName=pairName)
     with open(app.config['CONFIG_FILE']) as conf:
         config = json.load(conf)
-        db = PrimerDB(config['database'],dump=config['ampliconbed'])
+        db = PrimerDB(config['database'], dump=config['ampliconbed'], persistent=True)
         if updatePrimerPairName(pairName, newName, db):
             flash('Pair "%s" renamed "%s"' % (pairName, newName), 'success')
         else:
@@ -282,7 +282,7 @@ def updateLocationFromTable(primerInfo):
             return render_template('location_updated.html', status=None)
         with open(app.config['CONFIG_FILE']) as conf:
             config = json.load(conf)
-            db = PrimerDB(config['database'], dump=config['ampliconbed'])
+            db = PrimerDB(config['database'], dump=config['ampliconbed'], persistent=True)
         # run zippy and render
         updateStatus = updateLocation(primerName, loc, db, force)
         if updateStatus[0] == 'occupied':
@@ -321,7 +321,7 @@ def update_name_of_primer(primerInfo):
         return render_template('update_location_from_table.html', primerName=newName, primerLoc=primerLoc)
     with open(app.config['CONFIG_FILE']) as conf:
         config = json.load(conf)
-        db = PrimerDB(config['database'], dump=config['ampliconbed'])
+        db = PrimerDB(config['database'], dump=config['ampliconbed'], persistent=True)
         if updatePrimerName(currentName, newName, db):
             flash('Primer "%s" renamed "%s"' % (currentName, newName), 'success')
         else:
@@ -341,7 +341,7 @@ def search_by_name():
     searchName = session['searchName']
     with open(app.config['CONFIG_FILE']) as conf:
         config = json.load(conf)
-        db = PrimerDB(config['database'], dump=config['ampliconbed'])
+        db = PrimerDB(config['database'], dump=config['ampliconbed'], persistent=True)
         searchResult = searchByName(searchName, db)
     return render_template('searchname_result.html', searchResult=searchResult, searchName=searchName)
 
@@ -351,7 +351,7 @@ def blacklist_pair(pairname):
     print ('This is the pairname: ' + pairname, file=sys.stderr)
     with open(app.config['CONFIG_FILE']) as conf:
         config = json.load(conf)
-        db = PrimerDB(config['database'], dump=config['ampliconbed'])
+        db = PrimerDB(config['database'], dump=config['ampliconbed'], persistent=True)
         blacklisted = blacklistPair(pairname, db)
         for b in blacklisted:
             flash('%s added to blacklist' % (b,), 'success')
@@ -363,7 +363,7 @@ def delete_pair(pairname):
     print ('This is the pairname: ' + pairname, file=sys.stderr)
     with open(app.config['CONFIG_FILE']) as conf:
         config = json.load(conf)
-        db = PrimerDB(config['database'], dump=config['ampliconbed'])
+        db = PrimerDB(config['database'], dump=config['ampliconbed'], persistent=True)
         deleted = deletePair(pairname, db)
         for d in deleted:
             flash('%s deleted' % (d,), 'success')
@@ -383,7 +383,7 @@ def upload_samplesheet():
             updateList = readprimerlocations(saveloc)
             with open(app.config['CONFIG_FILE']) as conf:
                 config = json.load(conf)
-                db = PrimerDB(config['database'], dump=config['ampliconbed'])
+                db = PrimerDB(config['database'], dump=config['ampliconbed'], persistent=True)
                 for item in updateList:
                     updateStatus = updateLocation(item[0], item[1], db, True)  # Force is set to True, will force primers into any occupied locations
                     if updateStatus[0] == 'occupied':
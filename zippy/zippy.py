@@ -23,12 +23,21 @@ __status__ = "Production"
 import re
 import sys
 import json
-import tempfile
 import hashlib
 import csv
 import collections
 import time, logging
-from .zippylib.files import VCF, BED, GenePred, Interval, Data, readTargets, readBatch
+import multiprocessing
+from .zippylib.files import (
+    VCF,
+    BED,
+    GenePred,
+    Interval,
+    Data,
+    readTargets,
+    readBatch,
+    iterTargets,
+)
 from .zippylib.primer import (
     Genome,
     MultiFasta,
@@ -36,14 +45,21 @@ from .zippylib.primer import (
     Primer,
     PrimerPair,
     Location,
+    Locus,
     parsePrimerName,
+    Aligner,
+    snpAnnotation,
 )
 from .zippylib.reports import Test
 from .zippylib.database import PrimerDB
-from .zippylib.interval import IntervalList
-from .zippylib import ConfigError, Progressbar, banner, range_string
+from .zippylib.interval import IntervalList, intersectIntervals
+from .zippylib.cache import designCache, annotationStore
+from .zippylib.kmerindex import KmerAligner
+from .zippylib.handles import refreshAll as refreshHandles
+from .zippylib import ConfigError, Progressbar, banner, range_string, thermo, fileMD5
 from .zippylib.reports import Worksheet
 from argparse import ArgumentParser
+from contextlib import nullcontext
 from copy import deepcopy
 from collections import defaultdict, Counter
 from urllib.parse import unquote
@@ -53,24 +69,12 @@ sys.stderr = sys.stdout
 
 logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
 logger = logging.getLogger(__name__)
-gplist = None  # That global variable holds the GenePred object with all genes in refgene
+gplist = None  # That global variable holds the (indexed) GenePred intervals of all genes in refgene
 random_gene_names_re = re.compile(
     "LOC(\\d+)", re.IGNORECASE
 )  # regular expresion for random gene names
 
 
-def fileMD5(fi, block_size=2 ** 20):
-    """file MD5"""
-    md5 = hashlib.md5()
-    with open(fi, "rb") as fh:
-        while True:
-            data = fh.read(block_size)
-            if not data:
-                break
-            md5.update(data)
-    return md5.hexdigest()
-
-
 """import primer locations from table"""
 
 
@@ -182,6 +186,7 @@ def importPrimerPairs(inputfile, config, primer3=True):
         tmThreshold=config["design"]["mispriming"]["minimaltm"],
         endMatch=config["design"]["mispriming"]["identity3prime"],
     )  # places in genome
+    primerfile.close()  # release shared fasta handle
     # pair primers (by name or by primerset) MAKE COPIES!!!!
     pairs = {}
     for p in primers:
@@ -307,6 +312,124 @@ def importPrimerPairs(inputfile, config, primer3=True):
     return validPairs
 
 
+"""returns genome aligner for primer specificity (bowtie2 or k-mer index)"""
+
+
+def designAligner(config):
+    if config["design"].get("specificity", "bowtie2") == "kmerindex":
+        return KmerAligner(
+            config["design"]["kmerindex"],
+            tmThreshold=config["design"]["mispriming"]["minimaltm"],
+            endMatch=config["design"]["mispriming"]["identity3prime"],
+            minLength=min(p.get("PRIMER_MIN_SIZE", 18) for p in config["design"]["primer3"]),
+        )
+    return Aligner(
+        config["design"]["bowtieindex"],
+        threads=max(2, config["design"].get("workers", 1)),
+        tmThreshold=config["design"]["mispriming"]["minimaltm"],
+        endMatch=config["design"]["mispriming"]["identity3prime"],
+    )
+
+
+"""places Primer3 designed primer pairs on genome (in-memory equivalent of importPrimerPairs)"""
+
+
+def importDesignedPairs(designedPairs, aligner, db=None):
+    pairs = []
+    for iv, ivpairs in designedPairs.items():
+        for pairnumber, pair in enumerate(ivpairs):
+            setname = "_".join([iv.name, str(pairnumber)])
+            suffixes = ["rev", "fwd"] if iv.strand < 0 else ["fwd", "rev"]
+            for i, p in enumerate(pair):
+                # name by interval strand, set target locus from design (assume full match)
+                p.name = "_".join([setname, suffixes[i]])
+                p.targetposition = Locus(
+                    p.meta["POSITION"][0],
+                    p.meta["POSITION"][1],
+                    p.meta["POSITION"][2] - p.meta["POSITION"][1],
+                    bool(i),
+                    p.tm,
+                )
+            pair.name = pair.original_name = setname
+            pairs.append(pair)
+    primers = [p for pair in pairs for p in pair]
+    if db:  # reuse stored placements of known sequences
+        aligner.preload(db.placements([p.seq for p in primers if p.seq not in aligner.placements]))
+    print("Placing primers on genome...", file=sys.stderr)
+    aligner.place(primers)
+    # prune ranks (renames pair)
+    for pair in pairs:
+        pair.pruneRanks()
+    return pairs
+
+
+"""designs primers for a single interval (runs in design worker processes)"""
+
+
+def designIntervalPrimers(job):
+    genome, locus, name, flank, pars, cache = job
+    p3 = Primer3(genome, locus, flank)
+    p3.design(name, pars, cache)
+    return list(p3.pairs), p3.cached
+
+
+"""reads blacklisted primer pairs from database and blacklist cache"""
+
+
+def readBlacklist(config, db=None):
+    blacklist = db.blacklist() if db else []
+    try:
+        with open(config["blacklistcache"], "rb") as opf:
+            blacklist += pickle.load(opf)
+    except Exception as exc:
+        print(
+            "Could not read blacklist cache from",
+            config["blacklistcache"],
+            "error:",
+            exc,
+            file=sys.stderr,
+        )
+    return blacklist
+
+
+"""selects best primer pairs of intervals independently (always print database primers)"""
+
+
+def selectPrimers(ivpairs, config):
+    primerTable = []  # primer table (text)
+    primerVariants = defaultdict(list)  # primerpair -> intervalnames/variants dict
+    missedIntervals = []  # list of missed intervals/variants
+    for iv in sorted(ivpairs.keys(), key=lambda x: x.key()):  # ties by name
+        nomers = set((ivpair.name, ivpair.original_name) for ivpair in ivpairs[iv])
+        print(
+            "IV",
+            unquote(iv.name),
+            "names",
+            [
+                (ivpair.name, ivpair.designrank(), ivpair.original_name)
+                for ivpair in ivpairs[iv]
+            ],
+            file=sys.stderr,
+        )
+        if not ivpairs[iv]:
+            print("missing", iv, ivpairs[iv])
+            missedIntervals.append(iv)
+        for i, p in enumerate(sorted(ivpairs[iv])):
+            if i == config["report"]["pairs"]:
+                break  # only report number of primer pairs requested
+            # log primer design (0 if from database)
+            if p.designrank() >= 0:
+                p.log(config["logfile"])
+            # save result (with interval names)
+            primerVariants[p].append(iv)
+            # save to primer table
+            primerTable.append([unquote(iv.name)] + str(p).split("\t"))
+    # update primer pairs with covered variants
+    for pp, v in primerVariants.items():
+        pp.variants = v
+    return primerTable, list(primerVariants.keys()), missedIntervals
+
+
 """get primers from intervals"""
 
 
@@ -322,6 +445,11 @@ def getPrimers(
     noncoding=True,
     combine=True,
     getgenes=False,
+    blacklist=None,
+    cache=None,
+    aligner=None,
+    pool=None,
+    select=True,
 ):
     global gplist
     # noncoding = True
@@ -330,18 +458,15 @@ def getPrimers(
     initime = time.time()
     ivpairs = defaultdict(list)  # found/designed primer pairs (from database or design)
     flash_messages = []
-    blacklist = db.blacklist() if db else []
-    try:
-        with open(config["blacklistcache"], "rb") as opf:
-            blacklist += pickle.load(opf)
-    except Exception as exc:
-        print(
-            "Could not read blacklist cache from",
-            config["blacklistcache"],
-            "error:",
-            exc,
-            file=sys.stderr,
-        )
+    # blacklist, design cache, aligner and worker pool can be shared between calls
+    if blacklist is None:
+        blacklist = readBlacklist(config, db)
+    if cache is None:
+        cache = designCache(config)
+    if aligner is None:
+        aligner = designAligner(config)  # shared by all design rounds
+    thermo.configure(config["design"].get("thermocache", thermo.CACHESIZE))
+    refreshHandles()  # reopen reference and SNP files changed since last query
     seqhash = lambda x, y: hashlib.sha1(
         ",".join([x, y])
     ).hexdigest()  # sequence pair hashing function
@@ -369,7 +494,7 @@ def getPrimers(
             ]
             # redefine primer count (Get 2x more for compatibiliy pairs as they are cheap to design)
             cfg["PRIMER_NUM_RETURN"] *= 2
-            p3.design("gap-PCR", cfg)
+            p3.design("gap-PCR", cfg, cache)
             if p3.pairs:
                 for p in p3.pairs:
                     compatible.add(seqhash(p[0].seq, p[1].seq))
@@ -400,18 +525,15 @@ def getPrimers(
         if len(intervals_in_database) > 0:
             flash_messages.append((primers_found_in_DB_string, "info"))
     if rename and gplist is None:
-        with open(config["design"]["annotation"]) as fh:
-            # print("inigpl", time.time(), config['tiling'], gplist)
-            gplist = GenePred(
-                fh,
-                getgenes=getgenes,
-                combine=combine,
-                noncoding=noncoding,
-                name_to_dump=name_to_dump,
-                exon_numbering_base=config["exon_numbering_base"],
-                **config["tiling"]
-            )
-            # print("endgpl", time.time(), gplist)
+        # print("inigpl", time.time(), config['tiling'], gplist)
+        gplist = annotationStore(
+            config,
+            getgenes=getgenes,
+            combine=combine,
+            noncoding=noncoding,
+            name_to_dump=name_to_dump,
+        )
+        # print("endgpl", time.time(), gplist)
     # designing
     if design:
         print("starting design at", time.time(), tiers)
@@ -429,59 +551,66 @@ def getPrimers(
             )
             # Primer3 design
             designedPairs = {}
-            progress = Progressbar(len(insufficentAmpliconIntervals), "Designing primers")
-            for i, iv in enumerate(insufficentAmpliconIntervals):
-                sys.stderr.write("\r" + progress.show(i))
-                try:
-                    designIntervalOversize = max(
-                        [
-                            max(x)
-                            for x in config["design"]["primer3"][tier]["PRIMER_PRODUCT_SIZE_RANGE"]
-                        ]
-                    )
-                except:
-                    print(
+            try:
+                designIntervalOversize = max(
+                    [max(x) for x in config["design"]["primer3"][tier]["PRIMER_PRODUCT_SIZE_RANGE"]]
+                )
+            except:
+                print(
+                    "WARNING: could not determine maximum amplicon size, default setting applied",
+                    file=sys.stderr,
+                )
+                flash_messages.append(
+                    (
                         "WARNING: could not determine maximum amplicon size, default setting applied",
-                        file=sys.stderr,
+                        "warning",
                     )
-                    flash_messages.append(
-                        (
-                            "WARNING: could not determine maximum amplicon size, default setting applied",
-                            "warning",
-                        )
+                )
+                designIntervalOversize = 2000
+            jobs = [
+                (
+                    config["design"]["genome"],
+                    iv.locus(),
+                    iv.name,
+                    designIntervalOversize,
+                    config["design"]["primer3"][tier],
+                    cache,
+                )
+                for iv in insufficentAmpliconIntervals
+            ]
+            workers = min(config["design"].get("workers", 1), len(jobs))
+            progress = Progressbar(len(insufficentAmpliconIntervals), "Designing primers")
+            misses = cache.misses if cache else 0
+            if workers > 1:
+                # spread designs over worker processes (imap keeps interval order)
+                with nullcontext(pool) if pool else multiprocessing.Pool(workers) as workerpool:
+                    designs = workerpool.imap(
+                        designIntervalPrimers, jobs, max(1, len(jobs) // (4 * workers))
                     )
-                    designIntervalOversize = 2000
-                p3 = Primer3(config["design"]["genome"], iv.locus(), designIntervalOversize)
-                p3.design(iv.name, config["design"]["primer3"][tier])
-                if p3.pairs:
-                    designedPairs[iv] = p3.pairs
-                # else: print('\n' +'\n'.join(p3.explain), file=sys.stderr)
+                    for i, (iv, (p3pairs, cached)) in enumerate(
+                        zip(insufficentAmpliconIntervals, designs)
+                    ):
+                        sys.stderr.write("\r" + progress.show(i))
+                        if cache:
+                            cache.tally(cached)
+                        if p3pairs:
+                            designedPairs[iv] = p3pairs
+                if cache and cache.misses > misses:
+                    cache.refresh()  # evict once for designs cached by workers
+            else:
+                for i, (iv, job) in enumerate(zip(insufficentAmpliconIntervals, jobs)):
+                    sys.stderr.write("\r" + progress.show(i))
+                    p3pairs, cached = designIntervalPrimers(job)
+                    if cache:
+                        cache.tally(cached)
+                    if p3pairs:
+                        designedPairs[iv] = p3pairs
             sys.stderr.write("\r" + progress.show(len(insufficentAmpliconIntervals)) + "\n")
+            if cache:
+                print(str(cache), file=sys.stderr)
             if designedPairs:
-                ## import designed primer pairs (place on genome and get amplicons)
-                with tempfile.NamedTemporaryFile(
-                    suffix=".fa", prefix="primers_", delete=False, mode="wt"
-                ) as fh:
-                    for k, v in designedPairs.items():
-                        for pairnumber, pair in enumerate(v):
-                            print(
-                                pair[0].fasta(
-                                    "_".join(
-                                        [k.name, str(pairnumber), "rev" if k.strand < 0 else "fwd"]
-                                    )
-                                ),
-                                file=fh,
-                            )
-                            print(
-                                pair[1].fasta(
-                                    "_".join(
-                                        [k.name, str(pairnumber), "fwd" if k.strand < 0 else "rev"]
-                                    )
-                                ),
-                                file=fh,
-                            )
-                pairs = importPrimerPairs(fh.name, config, primer3=True)
-                os.unlink(fh.name)  # remove fasta file
+                ## place designed primer pairs on genome (in memory, get amplicons)
+                pairs = importDesignedPairs(designedPairs, aligner, db)
                 ## Remove non-specific and blacklisted primer pairs
                 specificPrimerPairs = []
                 blacklisted = 0
@@ -500,13 +629,15 @@ def getPrimers(
                     )
                 pairs = specificPrimerPairs
 
-                ## add SNPinfo (SNPcheck) for main target
+                ## add SNPinfo (SNPcheck) for main target (one sweep per source and chromosome)
+                annotation = snpAnnotation(config, [p.targetposition for pair in pairs for p in pair])
+                snpcache = {}  # combined result of sources per locus
                 progress = Progressbar(len(pairs), "SNPcheck")
                 for i, pair in enumerate(pairs):
                     sys.stderr.write("\r" + progress.show(i))
                     #ep = 0
                     for (ip, p) in enumerate(pair):
-                        accept = p.snpCheckPrimer(config)
+                        accept = p.snpCheckPrimer(config, annotation=annotation, cache=snpcache)
                         if not accept:
                             pair.name = False
                 sys.stderr.write("\r" + progress.show(len(pairs)) + "\n")
@@ -531,34 +662,15 @@ def getPrimers(
                             intervalprimers[pair.name].add(pair.uniqueid())
                             # rename (for variant based naming which is too rich)
                             if rename:
-                                matches = []
-                                for iv in gplist:  # get intervals from file or commandline
-                                    if pair[0].targetposition.chrom == iv.chrom:
-                                        targetend = (
-                                            pair[1].targetposition.offset
-                                            + pair[1].targetposition.length
-                                        )
-                                        assert targetend > pair[0].targetposition.offset
-                                        if (
-                                            (
-                                                pair[0].targetposition.offset
-                                                <= iv.chromStart
-                                                <= targetend
-                                            )
-                                            or (
-                                                pair[0].targetposition.offset
-                                                <= iv.chromEnd
-                                                <= targetend
-                                            )
-                                            or (
-                                                iv.chromStart
-                                                <= pair[0].targetposition.offset
-                                                <= iv.chromEnd
-                                            )
-                                            or (iv.chromStart <= targetend <= iv.chromEnd)
-                                        ):
-                                            matches.append(iv)
-                                            # break
+                                targetend = (
+                                    pair[1].targetposition.offset + pair[1].targetposition.length
+                                )
+                                assert targetend > pair[0].targetposition.offset
+                                matches = gplist.overlapping(
+                                    pair[0].targetposition.chrom,
+                                    pair[0].targetposition.offset,
+                                    targetend,
+                                )  # annotated intervals (in file order)
                                 if len(matches) == 0:
                                     pass  # assert 0
                                 elif len(matches) == 1:
@@ -639,11 +751,11 @@ def getPrimers(
         )
 
     # select primer pairs
-    primerTable = []  # primer table (text)
-    primerVariants = defaultdict(list)  # primerpair -> intervalnames/variants dict
-    missedIntervals = []  # list of missed intervals/variants
     print("========", file=sys.stderr)
     if compatible:
+        primerTable = []  # primer table (text)
+        primerVariants = defaultdict(list)  # primerpair -> intervalnames/variants dict
+        missedIntervals = []  # list of missed intervals/variants
         # make pairs and exclude all pairings not in compatibility list score by geometric mean of 1based rank
         rankedPairs = []
         for l, left in enumerate(sorted(ivpairs[intervals[0]])):
@@ -666,40 +778,21 @@ def getPrimers(
             primerTable.append([unquote(gapInterval.name)] + str(gapPrimerPair).split("\t"))
         else:
             missedIntervals = intervals
-    else:
-        # select by best pairs independently (always print database primers)
-        for iv in sorted(ivpairs.keys()):
-            nomers = set((ivpair.name, ivpair.original_name) for ivpair in ivpairs[iv])
-            print(
-                "IV",
-                unquote(iv.name),
-                "names",
-                [
-                    (ivpair.name, ivpair.designrank(), ivpair.original_name)
-                    for ivpair in ivpairs[iv]
-                ],
-                file=sys.stderr,
-            )
-            if not ivpairs[iv]:
-                print("missing", iv, ivpairs[iv])
-                missedIntervals.append(iv)
-            for i, p in enumerate(sorted(ivpairs[iv])):
-                if i == config["report"]["pairs"]:
-                    break  # only report number of primer pairs requested
-                # log primer design (0 if from database)
-                if p.designrank() >= 0:
-                    p.log(config["logfile"])
-                # save result (with interval names)
-                primerVariants[p].append(iv)
-                # save to primer table
-                primerTable.append([unquote(iv.name)] + str(p).split("\t"))
-    # update primer pairs with covered variants
-    for pp, v in primerVariants.items():
-        pp.variants = v
+        # update primer pairs with covered variants
+        for pp, v in primerVariants.items():
+            pp.variants = v
+        resultList = list(primerVariants.keys())
+    elif select:
+        primerTable, resultList, missedIntervals = selectPrimers(ivpairs, config)
+    if aligner.calls:
+        print(repr(aligner), file=sys.stderr)
+        print(thermo.report(), file=sys.stderr)
     endtime = time.time()
     elapsedtime = endtime - initime
     print("Zippy elapsed time", elapsedtime)
-    return primerTable, list(primerVariants.keys()), missedIntervals, flash_messages
+    if not select:
+        return ivpairs, flash_messages  # primer pairs of intervals (selected by caller)
+    return primerTable, resultList, missedIntervals, flash_messages
 
 
 # ==============================================================================
@@ -729,15 +822,11 @@ def zippyPrimerQuery(
         intervalsforfile = readTargets(
             targets[0], config["tiling"]
         )  # get intervals from file or commandline
-        overlappings = []
-        for intervalforlocus in intervalforlocus:
-            for intervalforfile in intervalsforfile:
-                if intervalforlocus.overlap(intervalforfile):
-                    intervalforfile.union_with(intervalforlocus)
-                    overlappings.append(intervalforfile)
-            intervals = overlappings
-    else:
+        intervals = intersectIntervals(intervalforlocus, intervalsforfile)
+    elif gap or not config["design"].get("chunksize"):
         intervals = readTargets(targets, config["tiling"])  # get intervals from file or commandline
+    else:  # read and design target files in chunks
+        intervals = None
     if gap:  # gap PCR primers
         try:
             assert len(intervals) == 1
@@ -756,20 +845,45 @@ def zippyPrimerQuery(
             )
         except:
             raise
-    primerTable, resultList, missedIntervals, more_flash_messages = getPrimers(
-        intervals,
-        db,
-        design,
-        config,
-        tiers,
-        compatible=True if gap else False,
-        rename=shortHumanReadable,
-        name_to_dump=name_to_dump,
-        noncoding=noncoding,
-        combine=combine,
-        getgenes=getgenes,
-    )
-    flash_messages.extend(more_flash_messages)
+    if intervals is None:
+        chunks = iterTargets(targets, config["tiling"], config["design"]["chunksize"])
+    else:
+        chunks = [intervals]
+    # design state shared by all chunks (blacklisted pairs are carried to next chunk)
+    blacklist = readBlacklist(config, db)
+    cache = designCache(config)
+    aligner = designAligner(config)
+    workers = config["design"].get("workers", 1)
+    sharedpool = intervals is None and design and workers > 1  # one worker pool for all chunks
+    ivpairs = {}  # primer pairs of all chunks
+    with multiprocessing.Pool(workers) if sharedpool else nullcontext() as pool:
+        for intervals in chunks:
+            result = getPrimers(
+                intervals,
+                db,
+                design,
+                config,
+                tiers,
+                compatible=True if gap else False,
+                rename=shortHumanReadable,
+                name_to_dump=name_to_dump,
+                noncoding=noncoding,
+                combine=combine,
+                getgenes=getgenes,
+                blacklist=blacklist,
+                cache=cache,
+                aligner=aligner,
+                pool=pool,
+                select=bool(gap),  # gap-PCR pairs are selected by getPrimers
+            )
+            if gap:
+                primerTable, resultList, missedIntervals, more_flash_messages = result
+            else:
+                chunkpairs, more_flash_messages = result
+                ivpairs.update(chunkpairs)
+            flash_messages.extend(more_flash_messages)
+    if not gap:  # select over all chunks (same order as unchunked query)
+        primerTable, resultList, missedIntervals = selectPrimers(ivpairs, config)
     # print primerTable
     if outfile:
         with open(outfile, "w") as fh:
@@ -842,25 +956,13 @@ def zippyBatchQuery(
             # get variants with no overlapping amplicon -> get variants which need new primer designs
             intervals = IntervalList([], source="GenePred")
             if designVariants:
-                with open(config["design"]["annotation"], "r", encoding="utf-8") as fh:
-                    for iv in GenePred(
-                        fh, getgenes=selectedgeneexons, exon_numbering_base=config["exon_numbering_base"],
-                        **config["tiling"]
-                    ):  # get intervals from file or commandline
-                        found = False
-                        for dv in designVariants:
-                            if not found and iv.overlap(dv):
-                                intervals.append(iv)
-                                found = True
-                            if found:
-                                break
-                        if found:
-                            break
+                # first annotated interval overlapping any variant
+                iv = annotationStore(config, getgenes=selectedgeneexons).first(designVariants)
+                if iv is not None:
+                    intervals.append(iv)
             # add full genes
             if fullgenes:
-                with open(config["design"]["annotation"]) as fh:
-                    intervals += GenePred(fh, getgenes=fullgenes,
-                        exon_numbering_base=config["exon_numbering_base"], **config["tiling"])
+                intervals += list(annotationStore(config, getgenes=fullgenes))
             # predesign and store
             if intervals:
                 primerTable, resultList, missedIntervals, more_flash_messages = getPrimers(
@@ -1104,6 +1206,13 @@ def main():
     global_group.add_argument(
         "--tiers", dest="tiers", default="0,1,2", help="Allowed design tiers (0,1,...,n)"
     )
+    global_group.add_argument(
+        "--workers",
+        dest="workers",
+        default=None,
+        type=int,
+        help="Primer3 design worker processes [config design.workers]",
+    )
 
     # run modes
     subparsers = parser.add_subparsers(help="Help for subcommand")
@@ -1259,10 +1368,12 @@ def main():
     # read config and open database
     with open(options.config, "rt") as conf:
         config = json.load(conf)#, object_hook=ascii_encode_dict)
+    if options.workers:
+        config["design"]["workers"] = options.workers
     # here = config['primerbed'] if 'primerbed' in config.keys() and config['primerbed'] else None
     # here = config['ampliconbed'] if 'ampliconbed' in config.keys() and config['ampliconbed'] else None
     here = getattr(options, "outfile", "")
-    db = PrimerDB(config["database"], dump=here)
+    db = PrimerDB(config["database"], dump=here, persistent=True)
 
     if options.which == "add":  # read primers and add to database
         # import primer pairs
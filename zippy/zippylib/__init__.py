@@ -12,6 +12,7 @@ __status__ = "Production"
 
 import time
 import os
+import hashlib
 import subprocess
 
 
@@ -59,6 +60,20 @@ def ascii_encode_dict(data):
     return dict(map(ascii_encode, pair) for pair in data.items())
 
 
+"""file MD5"""
+
+
+def fileMD5(fi, block_size=2 ** 20):
+    md5 = hashlib.md5()
+    with open(fi, "rb") as fh:
+        while True:
+            data = fh.read(block_size)
+            if not data:
+                break
+            md5.update(data)
+    return md5.hexdigest()
+
+
 """banner"""
 
 
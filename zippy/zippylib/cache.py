@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+
+__doc__ == """On-disk result caches"""
+__author__ = "David Brawand"
+__license__ = "MIT"
+__maintainer__ = "David Brawand"
+__email__ = "dbrawand@nhs.net"
+__status__ = "Production"
+
+import os
+import sys
+import json
+import pickle
+import tempfile
+import primer3
+from hashlib import sha1
+from . import fileMD5
+from .geneindex import geneIndex
+from .interval import IntervalIndex, IntervalStore
+
+CACHEVERSION = 2  # increment when parsed annotation objects change
+md5s = {}  # (annotation, size, mtime) -> MD5
+stores = {}  # annotation store key -> IntervalStore (shared memory maps)
+
+
+"""content-addressed cache of Primer3 design results (evicts least recently used files)"""
+
+
+class DesignCache(object):
+    def __init__(self, path, maxsize=1024):
+        self.path = path
+        self.maxsize = int(maxsize * 2 ** 20)  # MB
+        self.size = None  # lazily computed
+        self.hits = 0
+        self.misses = 0
+        self.worker = False  # copies in worker processes leave eviction to parent
+        os.makedirs(self.path, exist_ok=True)
+
+    def __str__(self):
+        total = self.hits + self.misses
+        return "<DesignCache {} hits:{} misses:{} ({:.1f}%)>".format(
+            self.path, self.hits, self.misses, 100.0 * self.hits / total if total else 0.0
+        )
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["worker"] = True
+        return state
+
+    def key(self, template, okregions, pars):
+        content = json.dumps(
+            [primer3.__version__, template, okregions, pars], sort_keys=True, separators=(",", ":")
+        )
+        return sha1(content.encode("UTF-8")).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key + ".pickle")
+
+    def get(self, key):
+        fi = self._file(key)
+        try:
+            with open(fi, "rb") as fh:
+                result = pickle.load(fh)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        try:
+            os.utime(fi)  # mark as recently used
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, result):
+        fi = self._file(key)
+        os.makedirs(os.path.dirname(fi), exist_ok=True)
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fi), suffix=".tmp")
+            with os.fdopen(fd, "wb") as fh:
+                pickle.dump(result, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, fi)  # atomic (concurrent writers)
+        except (IOError, OSError) as exc:
+            print("WARNING: could not write design cache ({})".format(exc), file=sys.stderr)
+            return
+        if self.worker:
+            return  # size unknown to parent (see refresh)
+        if self.size is not None:
+            self.size += os.path.getsize(fi)
+        self.evict()
+
+    def tally(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def _entries(self):
+        entries = []
+        for d in os.scandir(self.path):
+            if d.is_dir():
+                for f in os.scandir(d.path):
+                    if f.name.endswith(".pickle") or f.name.endswith(".npy"):
+                        st = f.stat()
+                        entries.append((st.st_mtime, st.st_size, f.path))
+        return entries
+
+    def refresh(self):
+        # recount size after writes of worker processes
+        self.size = None
+        self.evict()
+
+    def evict(self):
+        if self.size is not None and self.size <= self.maxsize:
+            return
+        entries = self._entries()
+        self.size = sum(e[1] for e in entries)
+        if self.size <= self.maxsize:
+            return
+        # remove oldest entries until 90% of maximum size
+        for mtime, size, fi in sorted(entries):
+            if self.size <= 0.9 * self.maxsize:
+                break
+            try:
+                os.unlink(fi)
+            except OSError:
+                continue
+            self.size -= size
+
+
+"""annotation file MD5 (memoized while file size and modification time are unchanged)"""
+
+
+def annotationMD5(annotation):
+    st = os.stat(annotation)
+    stamp = (annotation, st.st_size, st.st_mtime_ns)
+    if stamp not in md5s:
+        md5s[stamp] = fileMD5(annotation)
+    return md5s[stamp]
+
+
+"""cache of parsed annotation files (keyed by file MD5 and parser settings)"""
+
+
+class AnnotationCache(DesignCache):
+    def __str__(self):
+        return "<AnnotationCache {} hits:{} misses:{}>".format(self.path, self.hits, self.misses)
+
+    def key(self, annotation, settings):
+        content = json.dumps(
+            [CACHEVERSION, annotationMD5(annotation), settings],
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return sha1(content.encode("UTF-8")).hexdigest()
+
+    def store(self, key, intervals=None):
+        # memory mapped interval store (written from intervals if missing)
+        fi = os.path.join(self.path, key[:2], key + ".npy")
+        if intervals is not None and not os.path.exists(fi):
+            os.makedirs(os.path.dirname(fi), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fi), suffix=".tmp")
+            os.close(fd)
+            IntervalStore.write(tmp, intervals)
+            os.replace(tmp, fi)
+            self.evict()
+        try:
+            return IntervalStore(fi)
+        except (IOError, ValueError):
+            return None
+
+
+"""returns configured cache (None if not configured)"""
+
+
+def configuredCache(config, name, cls):
+    try:
+        cfg = config["cache"][name]
+        assert cfg["path"]
+    except (KeyError, TypeError, AssertionError):
+        return None
+    try:
+        return cls(cfg["path"], cfg.get("maxsize", 1024))
+    except OSError as exc:
+        print("WARNING: {} cache disabled ({})".format(name, exc), file=sys.stderr)
+        return None
+
+
+"""returns Primer3 design cache from configuration (None if not configured)"""
+
+
+def designCache(config):
+    return configuredCache(config, "primer3", DesignCache)
+
+
+"""returns annotation cache from configuration (None if not configured)"""
+
+
+def annotationCache(config):
+    return configuredCache(config, "annotation", AnnotationCache)
+
+
+"""GenePred parser settings (annotation cache key)"""
+
+
+def annotationSettings(config, getgenes=None, combine=True, noncoding=False):
+    return dict(
+        config["tiling"],
+        getgenes=sorted(set(getgenes)) if getgenes else None,
+        combine=combine,
+        noncoding=noncoding,
+        exon_numbering_base=config["exon_numbering_base"],
+    )
+
+
+"""reads GenePred intervals of configured annotation (parsed once, then loaded from cache)"""
+
+
+def readGenePred(config, getgenes=None, combine=True, noncoding=False, name_to_dump=None):
+    from .files import GenePred
+
+    annotation = config["design"]["annotation"]
+    settings = annotationSettings(config, getgenes, combine, noncoding)
+    cache = annotationCache(config)
+    if cache and name_to_dump is None:
+        key = cache.key(annotation, settings)
+        genes = cache.get(key)
+        cache.tally(genes is not None)
+        if genes is not None:
+            print("Loaded {} from {}".format(annotation, cache), file=sys.stderr)
+            return genes
+    if getgenes and not noncoding:
+        # read lines of selected genes only
+        lines = geneIndex(annotation).lines(getgenes)
+        genes = GenePred(lines, name_to_dump=name_to_dump, **settings)
+    else:
+        with open(annotation, "r", encoding="utf-8") as fh:
+            genes = GenePred(fh, name_to_dump=name_to_dump, **settings)
+    if cache and name_to_dump is None:
+        cache.put(key, genes)
+    return genes
+
+
+"""annotated intervals as shared memory mapped store (IntervalIndex if no annotation cache)"""
+
+
+def annotationStore(config, getgenes=None, combine=True, noncoding=False, name_to_dump=None):
+    cache = annotationCache(config)
+    if not cache or name_to_dump is not None:
+        return IntervalIndex(
+            readGenePred(config, getgenes, combine, noncoding, name_to_dump=name_to_dump)
+        )
+    settings = annotationSettings(config, getgenes, combine, noncoding)
+    key = cache.key(config["design"]["annotation"], settings)
+    if key not in stores:
+        store = cache.store(key)
+        if store is None:
+            try:
+                store = cache.store(key, readGenePred(config, getgenes, combine, noncoding))
+            except (IOError, OSError) as exc:
+                print("WARNING: could not write annotation store ({})".format(exc), file=sys.stderr)
+        if store is None:
+            return IntervalIndex(readGenePred(config, getgenes, combine, noncoding))
+        stores[key] = store
+    return stores[key]
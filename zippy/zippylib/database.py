@@ -10,6 +10,8 @@ __email__ = "dbrawand@nhs.net"
 __status__ = "Production"
 
 import sys, os, re, ast, pwd
+import atexit
+import threading
 import datetime
 import json
 import hashlib
@@ -18,7 +20,7 @@ import fnmatch
 import primer3
 from copy import deepcopy
 from collections import defaultdict
-from . import flatten, PrimerNameChangeError
+from . import flatten, PrimerNameChangeError, thermo
 from .primer import Primer, Locus, PrimerPair, Location, parsePrimerName
 
 def username():
@@ -48,11 +50,21 @@ def changeConflictingName(n):
         return '_'.join(f[:2]+['1']+f[2:])
     raise PrimerNameChangeError('proposed name parts are {0}'.format(f))
 
+connections = {}  # (database, pid, thread) -> persistent connection
+
+def closeConnections():
+    for key in [ k for k in connections.keys() if k[1] == os.getpid() ]:
+        connections.pop(key).close()
+
+atexit.register(closeConnections)
+
 # Primer Database
 class PrimerDB(object):
-    def __init__(self, database, dump=None):
+    def __init__(self, database, dump=None, persistent=False):
         # open database and get a cursor
         self.sqlite = database
+        self.persistent = persistent  # keep one connection per process and thread
+        self.local = threading.local()
         try:
             self.db = sqlite3.connect(self.sqlite)
         except Exception as exc:
@@ -98,6 +110,8 @@ class PrimerDB(object):
                 FOREIGN KEY(seq) REFERENCES primer(seq) ON DELETE CASCADE);''')
             cursor.execute('''CREATE TABLE IF NOT EXISTS blacklist(
                 uniqueid TEXT PRIMARY KEY, blacklistdate TEXT);''')
+            # interval index of amplicon inserts (kept in sync with pairs by triggers)
+            self.rtree = self.createIntervalIndex(cursor)
             self.db.commit()
         except:
             print(self.sqlite, file=sys.stderr)
@@ -108,12 +122,134 @@ class PrimerDB(object):
             self.db.close()
         return
 
+    def createIntervalIndex(self, cursor):
+        '''creates R*Tree of pair inserts (index on pairs coordinates if sqlite has no R*Tree module)'''
+        cursor.execute('''SELECT count(*) FROM sqlite_master
+            WHERE name IN ('pairs_rtree', 'pairs_rtree_key', 'pairs_rtree_chrom');''')
+        exists = cursor.fetchone()[0] == 3
+        if not exists:  # (re)build incomplete index or R*Tree of earlier schema
+            for trigger in ('pairs_rtree_insert', 'pairs_rtree_update', 'pairs_rtree_delete',
+                'primer_rtree_insert', 'primer_rtree_update'):
+                cursor.execute('''DROP TRIGGER IF EXISTS {};'''.format(trigger))
+            cursor.execute('''DROP TABLE IF EXISTS pairs_rtree;''')
+            cursor.execute('''DROP TABLE IF EXISTS pairs_rtree_key;''')
+            cursor.execute('''DROP TABLE IF EXISTS pairs_rtree_chrom;''')
+        try:
+            # integer chromosome codes and coordinates (exact beyond 2^24)
+            cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS pairs_rtree
+                USING rtree_i32(id, minchrom, maxchrom, start, end);''')
+        except sqlite3.OperationalError:
+            cursor.execute('''CREATE INDEX IF NOT EXISTS pairs_interval ON pairs(chrom, start, end);''')
+            return False
+        # stable R*Tree ids of pairs (implicit rowids can change on VACUUM)
+        cursor.execute('''CREATE TABLE IF NOT EXISTS pairs_rtree_key(
+            id INTEGER PRIMARY KEY, pairid TEXT UNIQUE);''')
+        cursor.execute('''CREATE TABLE IF NOT EXISTS pairs_rtree_chrom(
+            id INTEGER PRIMARY KEY, chrom TEXT UNIQUE);''')
+        keys = '''INSERT OR IGNORE INTO pairs_rtree_key(pairid) SELECT pairid FROM pairs AS p WHERE {0};
+            INSERT OR IGNORE INTO pairs_rtree_chrom(chrom) SELECT chrom FROM pairs AS p WHERE {0};'''
+        entries = '''INSERT INTO pairs_rtree(id, minchrom, maxchrom, start, end)
+                SELECT k.id, c.id, c.id, p.start + length(l.seq), p.end - length(r.seq)
+                FROM pairs AS p, pairs_rtree_key AS k, pairs_rtree_chrom AS c, primer AS l, primer AS r
+                WHERE k.pairid = p.pairid AND c.chrom = p.chrom AND l.name = p.left AND r.name = p.right
+                AND p.start + length(l.seq) <= p.end - length(r.seq) AND {0};'''
+        insert = keys + entries
+        delete = '''DELETE FROM pairs_rtree WHERE id IN (SELECT id FROM pairs_rtree_key WHERE {0});
+            DELETE FROM pairs_rtree_key WHERE {0};'''
+        cursor.execute('''CREATE TRIGGER IF NOT EXISTS pairs_rtree_insert AFTER INSERT ON pairs
+            BEGIN {} END;'''.format(insert.format('p.pairid = new.pairid')))
+        cursor.execute('''CREATE TRIGGER IF NOT EXISTS pairs_rtree_update
+            AFTER UPDATE OF pairid, chrom, start, end, left, right ON pairs
+            BEGIN {} {} END;'''.format(delete.format('pairid = old.pairid'), insert.format('p.pairid = new.pairid')))
+        cursor.execute('''CREATE TRIGGER IF NOT EXISTS pairs_rtree_delete AFTER DELETE ON pairs
+            BEGIN {} END;'''.format(delete.format('pairid = old.pairid')))
+        # reindex pairs of renamed or added primers (pairs are renamed before their primers)
+        primerpairs = 'pairid IN (SELECT pairid FROM pairs WHERE left = new.name OR right = new.name)'
+        reindex = delete.format(primerpairs) + insert.format('p.' + primerpairs)
+        cursor.execute('''CREATE TRIGGER IF NOT EXISTS primer_rtree_insert AFTER INSERT ON primer
+            BEGIN {} END;'''.format(reindex))
+        cursor.execute('''CREATE TRIGGER IF NOT EXISTS primer_rtree_update AFTER UPDATE OF name, seq ON primer
+            BEGIN {} END;'''.format(reindex))
+        if not exists:  # index pairs of existing database
+            for statement in (keys + entries).format('1').split(';')[:-1]:
+                cursor.execute(statement)
+        return True
+
     def __str__(self):
         return '<ZippyDB at %s>' % self.sqlite
 
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['local']  # connections stay with their process
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local = threading.local()
+
+    @property
+    def db(self):
+        return self.local.db
+
+    @db.setter
+    def db(self, connection):
+        self.local.db = connection
+
+    def connect(self):
+        '''returns connection (shared by calls of this process and thread if persistent or in a transaction)'''
+        if getattr(self.local, 'transaction', None):
+            return self.local.transaction[0]
+        if not self.persistent:
+            return sqlite3.connect(self.sqlite)
+        key = (self.sqlite, os.getpid(), threading.get_ident())
+        if key not in connections:
+            connection = sqlite3.connect(self.sqlite)
+            connection.execute('PRAGMA temp_store = MEMORY')
+            connection.execute('PRAGMA cache_size = -16384')  # 16MB
+            connections[key] = connection
+        return connections[key]
+
+    def release(self):
+        '''closes connection (persistent connections are kept without uncommitted changes)'''
+        if getattr(self.local, 'transaction', None):
+            return  # committed or rolled back at end of transaction
+        if self.persistent:
+            if self.db.in_transaction:
+                self.db.rollback()
+            self.db.execute('PRAGMA foreign_keys = OFF')
+        else:
+            self.db.close()
+
+    def commit(self):
+        if not getattr(self.local, 'transaction', None):
+            self.db.commit()
+
+    def __enter__(self):
+        '''explicit transaction (all changes are committed or rolled back together)'''
+        if getattr(self.local, 'transaction', None):
+            self.local.transaction[1] += 1  # nested
+        else:
+            self.local.transaction = [self.connect(), 1]
+        self.db = self.local.transaction[0]
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.local.transaction[1] -= 1
+        if self.local.transaction[1]:
+            return False
+        connection = self.local.transaction[0]
+        self.local.transaction = None
+        if exc_type is None:
+            connection.commit()
+        else:
+            connection.rollback()
+        self.db = connection
+        self.release()
+        return False
+
     def __repr__(self):
         try:
-            self.db = sqlite3.connect(self.sqlite)
+            self.db = self.connect()
         except:
             raise
         else:
@@ -125,14 +261,14 @@ class PrimerDB(object):
                 LEFT JOIN primer as r ON r.name = p.right;''')
             rows = cursor.fetchall()
         finally:
-            self.db.close()
+            self.release()
         return "\n".join([ '{:<20} {:40} {:>20} {:<25} {:>20} {:<25} {:>8} {:>9d} {:>9d} {} {}'.format(*row) for row in rows ])
 
     def writeAmpliconDump(self):
         ## dump amplicons to bed file
         if self.dumpl:
             try:
-                self.db = sqlite3.connect(self.sqlite)
+                self.db = self.connect()
             except:
                 raise
             else:
@@ -154,11 +290,11 @@ class PrimerDB(object):
                 except:
                     raise
             finally:
-                self.db.close()
+                self.release()
 
     def removeOrphans(self):
         try:
-            self.db = sqlite3.connect(self.sqlite)
+            self.db = self.connect()
         except:
             raise
         else:
@@ -171,15 +307,15 @@ class PrimerDB(object):
             orphans = cursor.fetchall()
             cursor.executemany('''DELETE FROM primer
                 WHERE name = ?''', orphans)
-            self.db.commit()
+            self.commit()
             return [ x[0] for x in orphans ]
         finally:
-            self.db.close()
+            self.release()
 
     '''show/update blacklist'''
     def blacklist(self,add=None,justdelete=False):
         try:
-            self.db = sqlite3.connect(self.sqlite)
+            self.db = self.connect()
         except:
             raise
         else:
@@ -208,7 +344,7 @@ class PrimerDB(object):
                     # delete all those pairs from pairs table
                     second_cursor.execute('''DELETE FROM pairs
                     WHERE uniqueid = ?;''', (uid,))
-                    self.db.commit()
+                    self.commit()
                 return pairlist
             else: #return list of uniqueids from blacklist
                 cursor = self.db.cursor()
@@ -216,7 +352,7 @@ class PrimerDB(object):
                 rows = cursor.fetchall()
                 return [ row[0] for row in rows ]
         finally:
-            self.db.close()
+            self.release()
             self.removeOrphans()
             self.writeAmpliconDump()
 
@@ -225,7 +361,7 @@ class PrimerDB(object):
     def addPrimer(self, *primers):
         messages = []
         try:
-            self.db = sqlite3.connect(self.sqlite)
+            self.db = self.connect()
         except:
             raise
         else:
@@ -257,9 +393,9 @@ class PrimerDB(object):
                 for l in p.loci:
                     cursor.execute('''INSERT OR IGNORE INTO target(seq,chrom,position,reverse,tm) VALUES(?,?,?,?,?)''', \
                         (p.seq, l.chrom, l.offset, l.reverse, l.tm))
-            self.db.commit()
+            self.commit()
         finally:
-            self.db.close()
+            self.release()
             self.writeAmpliconDump()
         return messages
 
@@ -273,7 +409,7 @@ class PrimerDB(object):
         messages = self.addPrimer(*flat)
         # add pairs
         try:
-            self.db = sqlite3.connect(self.sqlite)
+            self.db = self.connect()
         except:
             raise
         else:
@@ -288,9 +424,9 @@ class PrimerDB(object):
                 end = p[1].targetposition.offset+p[1].targetposition.length
                 cursor.execute('''INSERT OR IGNORE INTO pairs(pairid,uniqueid,left,right,chrom,start,end,dateadded,comments) VALUES(?,?,?,?,?,?,?,?,?)''', \
                     (p.name, p.uniqueid(), p[0].name, p[1].name, chrom, start, end, current_time, p.comments))
-            self.db.commit()
+            self.commit()
         finally:
-            self.db.close()
+            self.release()
             self.writeAmpliconDump()
         return messages
 
@@ -299,7 +435,7 @@ class PrimerDB(object):
         '''returns suitable primer pairs for the specified interval'''
         messages = []
         try:
-            self.db = opendb if opendb else sqlite3.connect(self.sqlite)
+            self.db = opendb if opendb else self.connect()
         except:
             raise
         else:
@@ -335,18 +471,23 @@ class PrimerDB(object):
                     WHERE p.chrom = ?
                     AND p.start + length(l.seq) <= ?
                     AND p.end - length(r.seq) >= ?
-                    ORDER BY midpointdistance;''', \
-                    (int(query.chromStart+int(query.chromEnd-query.chromStart)/2.0), query.chrom, query.chromStart, query.chromEnd))
+                    {}
+                    ORDER BY midpointdistance;'''.format(
+                        '''AND p.pairid IN (SELECT k.pairid FROM pairs_rtree_chrom AS c, pairs_rtree AS t, pairs_rtree_key AS k
+                            WHERE c.chrom = ? AND t.minchrom <= c.id AND t.maxchrom >= c.id
+                            AND t.start <= ? AND t.end >= ? AND k.id = t.id)''' if self.rtree else ''), \
+                    (int(query.chromStart+int(query.chromEnd-query.chromStart)/2.0), query.chrom, query.chromStart, query.chromEnd) + \
+                    ((query.chrom, query.chromStart, query.chromEnd) if self.rtree else ()))
             rows = cursor.fetchall()
         finally:
             if not opendb:
-                self.db.close()
+                self.release()
         # return primer pairs that would match
         primerPairs = []
         for row in rows:
             # build targets
-            leftTargetposition = Locus(row[7], row[8], len(row[3]), False, primer3.calcTm(str(row[3])))
-            rightTargetposition = Locus(row[7], row[9]-len(row[4]), len(row[4]), True, primer3.calcTm(str(row[4])))
+            leftTargetposition = Locus(row[7], row[8], len(row[3]), False, thermo.calcTm(str(row[3])))
+            rightTargetposition = Locus(row[7], row[9]-len(row[4]), len(row[4]), True, thermo.calcTm(str(row[4])))
             # build storage locations (if available)
             leftLocation = Location(*row[10:12]) if all(row[10:12]) else None
             rightLocation = Location(*row[12:14]) if all(row[12:14]) else None
@@ -374,10 +515,33 @@ class PrimerDB(object):
                                           comments=row[15]))
         return (primerPairs, messages)  # ordered by midpoint distance
 
+    def placements(self, seqs):
+        '''returns stored genome placements of known primer sequences (seq -> [(chrom,position,reverse,tm)])'''
+        placements = defaultdict(list)
+        seqs = list(set(seqs))
+        try:
+            self.db = self.connect()
+        except:
+            raise
+        else:
+            cursor = self.db.cursor()
+            for i in range(0, len(seqs), 500):  # stay below sqlite variable limit
+                chunk = seqs[i:i+500]
+                cursor.execute('''SELECT t.seq, t.chrom, t.position, t.reverse, t.tm
+                    FROM target AS t
+                    WHERE t.seq IN ({})
+                    AND EXISTS (SELECT 1 FROM primer AS p WHERE p.seq = t.seq)
+                    ORDER BY t.rowid;'''.format(','.join('?'*len(chunk))), chunk)
+                for row in cursor.fetchall():
+                    placements[row[0]].append((row[1], row[2], bool(row[3]), row[4]))
+        finally:
+            self.release()
+        return dict(placements)
+
     def getLocation(self, loc):
         '''returns whats stored at location'''
         try:
-            self.db = sqlite3.connect(self.sqlite)
+            self.db = self.connect()
         except:
             raise
         else:
@@ -386,13 +550,13 @@ class PrimerDB(object):
                 WHERE vessel = ? AND well LIKE ?;''', (loc.vessel(),'%'+loc.well()+'%') )
             return [ x[0] for x in cursor.fetchall() ]
         finally:
-            self.db.close()
+            self.release()
 
     def getRedundantPrimers(self):
         '''returns redundant primer (same tag and sequence)'''
         redundant = defaultdict(list)
         try:
-            self.db = sqlite3.connect(self.sqlite)
+            self.db = self.connect()
         except:
             raise
         else:
@@ -405,12 +569,12 @@ class PrimerDB(object):
             # return list of list
             return [ [k[0], k[1], ','.join(v)] for k,v in redundant.items() ], ['seq','tag','synonyms']
         finally:
-            self.db.close()
+            self.release()
 
     def addLocations(self, *locations):
         '''updates location for a batch of primers'''
         try:
-            self.db = sqlite3.connect(self.sqlite)
+            self.db = self.connect()
         except:
             raise
         else:
@@ -420,16 +584,16 @@ class PrimerDB(object):
                 cursor.executemany('''UPDATE OR IGNORE primer
                     SET vessel = ?, well = ? WHERE name = ?''', \
                     ((loc.vessel(), loc.well(), primerid) for primerid, loc in locations))
-                self.db.commit()
+                self.commit()
             except:
                 raise
         finally:
-            self.db.close()
+            self.release()
         return
 
     def updatePrimerPairsComments(self, comments_multidict):
         try:
-            self.db = sqlite3.connect(self.sqlite)
+            self.db = self.connect()
         except:
             raise
         else:
@@ -437,16 +601,16 @@ class PrimerDB(object):
             cursor.executemany('''UPDATE OR IGNORE pairs
                 SET comments = ? WHERE pairid = ?''', \
                 ((comments, primerid[9:]) for primerid, comments in comments_multidict.items() if primerid.startswith("comments_")))
-            self.db.commit()
+            self.commit()
         finally:
-            self.db.close()
+            self.release()
         return
 
 
     def storePrimer(self,primerid,loc,force=False):
         '''updates the location in which primers are stored'''
         try:
-            self.db = sqlite3.connect(self.sqlite)
+            self.db = self.connect()
         except:
             raise
         else:
@@ -456,7 +620,7 @@ class PrimerDB(object):
                     cursor = self.db.cursor()
                     cursor.execute('''UPDATE OR IGNORE primer SET vessel = NULL, well = NULL
                         WHERE vessel = ? AND well = ?''', (loc.vessel(), loc.well()))
-                    self.db.commit()
+                    self.commit()
                 except:
                     raise
             # update
@@ -464,7 +628,7 @@ class PrimerDB(object):
                 cursor = self.db.cursor()
                 cursor.execute('''UPDATE OR ABORT primer SET vessel = ?, well = ?
                     WHERE name = ?''', (loc.vessel(), loc.well(), primerid))
-                self.db.commit()
+                self.commit()
             except sqlite3.IntegrityError:
                 return False
             except:
@@ -480,13 +644,13 @@ class PrimerDB(object):
             except:
                 raise
         finally:
-            self.db.close()
+            self.release()
         return True
 
     def updateName(self, primerName, newName):
         '''changes the name of a primer stored in the database'''
         try:
-            self.db = sqlite3.connect(self.sqlite)
+            self.db = self.connect()
         except:
             raise
         else:
@@ -499,7 +663,7 @@ class PrimerDB(object):
                     WHERE right = ?;''', (newName, primerName))
                 cursor.execute('''UPDATE OR ABORT primer SET name = ?
                     WHERE name = ?;''', (newName, primerName))
-                self.db.commit()
+                self.commit()
             except sqlite3.IntegrityError:
                 return False
             except:
@@ -516,13 +680,13 @@ class PrimerDB(object):
             except:
                 raise
         finally:
-            self.db.close()
+            self.release()
             self.writeAmpliconDump()
 
     def updatePairName(self,pairName,newName):
         '''changes the name of a primer stored in the database'''
         try:
-            self.db = sqlite3.connect(self.sqlite)
+            self.db = self.connect()
         except:
             raise
         else:
@@ -531,7 +695,7 @@ class PrimerDB(object):
                 cursor = self.db.cursor()
                 cursor.execute('''UPDATE OR ABORT pairs SET pairid = ?
                     WHERE pairid = ?;''', (newName, pairName))
-                self.db.commit()
+                self.commit()
             except sqlite3.IntegrityError:
                 return False
             except:
@@ -548,14 +712,14 @@ class PrimerDB(object):
             except:
                 raise
         finally:
-            self.db.close()
+            self.release()
             self.writeAmpliconDump()
 
     def dump(self,what,**kwargs):
         if what == 'amplicons':
             # dump amplicons (all possible)
             try:
-                self.db = sqlite3.connect(self.sqlite)
+                self.db = self.connect()
             except:
                 raise
             else:
@@ -571,12 +735,12 @@ class PrimerDB(object):
                         ORDER BY p.chrom, p.start;''')
                 rows = cursor.fetchall()
             finally:
-                self.db.close()
+                self.release()
             return rows, ('chrom','chromStart','chromEnd','name')  # rows and colnames
             # return [ '{}\t{}\t{}\t{}'.format(*row) for row in rows ]
         elif what == 'ordersheet':
             try:
-                self.db = sqlite3.connect(self.sqlite)
+                self.db = self.connect()
             except:
                 raise
             else:
@@ -596,7 +760,7 @@ class PrimerDB(object):
                     ORDER BY pairname, direction;''')
                 rows = cursor.fetchall()
             finally:
-                self.db.close()
+                self.release()
             # define columns
             columns = ['pairname', 'primername', 'sequence', 'seqtag', 'direction']
             # add tags and extra columns
@@ -628,7 +792,7 @@ class PrimerDB(object):
         elif what=='locations':
             # dump locations (all possible)
             try:
-                self.db = sqlite3.connect(self.sqlite)
+                self.db = self.connect()
             except:
                 raise
             else:
@@ -643,12 +807,12 @@ class PrimerDB(object):
                         WHERE pp.right = p.name;''')
                 rows = cursor.fetchall()
             finally:
-                self.db.close()
+                self.release()
             return rows, ['pair', 'primer', 'vessel', 'well']
         elif what=='table':
             # dump table with pairs primers and locations (which can be reimported)
             try:
-                self.db = sqlite3.connect(self.sqlite)
+                self.db = self.connect()
             except:
                 raise
             else:
@@ -664,5 +828,5 @@ class PrimerDB(object):
                     ORDER BY pairid;''')
                 rows = cursor.fetchall()
             finally:
-                self.db.close()
+                self.release()
             return rows, ['primername', 'primerset', 'tag', 'sequence', 'vessel', 'well']
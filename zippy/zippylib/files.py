@@ -12,6 +12,7 @@ __status__ = "Production"
 import sys
 import re
 import os
+import heapq
 import pysam
 from math import ceil
 from collections import Counter, defaultdict
@@ -21,6 +22,39 @@ from .interval import *
 from urllib.parse import quote, unquote
 
 
+"""agglomerative combination of sorted exons (merges closest neighbours while spanning less than interval)"""
+
+
+def combineExons(exons, interval):
+    groups = [[e] for e in exons]
+    starts = [e.chromStart for e in exons]
+    ends = [e.chromEnd for e in exons]
+    nxt = list(range(1, len(groups))) + [None]
+    prv = [None] + list(range(len(groups) - 1))
+    span = lambda i: ends[nxt[i]] - starts[i]  # distance of neighbouring groups
+    heap = [(span(i), i, nxt[i]) for i in range(len(groups) - 1)]
+    heapq.heapify(heap)  # ties resolved by position as in a linear scan
+    while heap:
+        d, i, j = heap[0]
+        if groups[i] is None or nxt[i] != j or span(i) != d:
+            heapq.heappop(heap)  # outdated
+            continue
+        if not d < interval:
+            break
+        heapq.heappop(heap)
+        # merge group j into i
+        groups[i] += groups[j]
+        starts[i], ends[i] = min(starts[i], starts[j]), max(ends[i], ends[j])
+        groups[j] = None
+        nxt[i] = nxt[j]
+        if nxt[i] is not None:
+            prv[nxt[i]] = i
+            heapq.heappush(heap, (span(i), i, nxt[i]))
+        if prv[i] is not None:
+            heapq.heappush(heap, (span(prv[i]), prv[i], i))
+    return [g for g in groups if g is not None]
+
+
 class GenePred(IntervalList):
     """GenePred parser with automatic segment numbering and tiling"""
 
@@ -118,29 +152,7 @@ class GenePred(IntervalList):
             for g in genelist:
                 if combine:
                     # iteratively combine closest exons
-                    combinedExons = [[x] for x in sorted(g.subintervals)]
-                    while True:
-                        # get distances
-                        distances = [
-                            max([x.chromEnd for x in combinedExons[i]])
-                            - min([x.chromStart for x in combinedExons[i - 1]])
-                            for i in range(1, len(combinedExons))
-                        ]
-                        # combine smallest distance
-                        if any([d < interval for d in distances]):
-                            smallestIndex = distances.index(min(distances))
-                            recombinedExons = []
-                            for i, e in enumerate(combinedExons):
-                                if i > smallestIndex:  # merge with previous and add remainder
-                                    recombinedExons[-1] += e
-                                    if i + 1 < len(combinedExons):
-                                        recombinedExons += combinedExons[i + 1:]
-                                    break
-                                else:
-                                    recombinedExons.append(e)
-                            combinedExons = recombinedExons
-                        else:
-                            break
+                    combinedExons = combineExons(sorted(g.subintervals), interval)
                     # add exon numbers
                     i = 0
                     for e in combinedExons:
@@ -186,22 +198,64 @@ class GenePred(IntervalList):
                         if e.name == "1_1":
                             print("newname", e.name, type(e))
                         intervalindex[e.name].append(e)
-        # split interval if necessary
-        for ivs in intervalindex.values():
-            for iv in ivs:
-                if interval and overlap and interval < len(iv):
-                    assert "+" not in iv.name  # paranoia
-                    self += iv.tile(
-                        interval, overlap, len(f) > 3
-                    )  # name with suffix if named interval
-                else:
-                    self += [iv]
-        # add flanks
-        for e in self:
-            e.extend(flank)
+        # split interval if necessary and add flanks
+        intervals = IntervalArray.fromIntervals(
+            [iv for ivs in intervalindex.values() for iv in ivs]
+        )
+        if interval and overlap and len(intervals):
+            assert not any(
+                "+" in name for name in intervals.names[intervals.end - intervals.start > interval]
+            )  # paranoia
+            intervals = intervals.tile(
+                interval, overlap, len(f) > 3
+            )  # name with suffix if named interval
+        self += intervals.extend(flank).toIntervals()
         return
 
 
+"""interval from BED fields"""
+
+
+def bedInterval(f):
+    try:
+        if len(f) > 5:  # name/strand
+            return Interval(f[0], int(f[1]), int(f[2]), f[3], f[5].startswith("-"))
+        elif len(f) > 3:  # name
+            return Interval(f[0], int(f[1]), int(f[2]), f[3])
+        else:  # automatic naming
+            return Interval(f[0], int(f[1]), int(f[2]))
+    except:
+        print(f, file=sys.stderr)
+        raise
+
+
+"""streaming bed reader (names counted in a first pass, intervals yielded in file order)"""
+
+
+def iterBED(fi, interval=None, overlap=None, flank=0):
+    counts, named = Counter(), False
+    with open(fi) as fh:
+        for line in fh:
+            if not (line.startswith("#") or line.startswith("track")):
+                f = line.split()
+                counts[bedInterval(f).name] += 1
+                named = len(f) > 3  # name with suffix if named interval (last line)
+    seen = Counter()
+    with open(fi) as fh:
+        for line in fh:
+            if line.startswith("#") or line.startswith("track"):
+                continue
+            iv = bedInterval(line.split())
+            if counts[iv.name] > 1:  # suffix interval names if necessary
+                seen[iv.name] += 1
+                iv.name += "-{:02d}".format(seen[iv.name])
+            if interval and overlap and interval < len(iv):
+                for tile in iv.tile(interval, overlap, named):
+                    yield tile.extend(flank)
+            else:
+                yield iv.extend(flank)
+
+
 """bed parser with automatic segment numbering and tiling"""
 
 
@@ -216,37 +270,48 @@ class BED(IntervalList):
             else:
                 # create interval
                 f = line.split()
-                try:
-                    if len(f) > 5:  # name/strand
-                        iv = Interval(f[0], int(f[1]), int(f[2]), f[3], f[5].startswith("-"))
-                    elif len(f) > 3:  # name
-                        iv = Interval(f[0], int(f[1]), int(f[2]), f[3])
-                    else:  # automatic naming
-                        iv = Interval(f[0], int(f[1]), int(f[2]))
-                except:
-                    print(f, file=sys.stderr)
-                    raise
+                iv = bedInterval(f)
                 intervalindex[iv.name].append(iv)
         # suffix interval names if necessary
         for ivs in intervalindex.values():
             if len(ivs) > 1:
                 for i, iv in enumerate(ivs):
                     iv.name += "-{:02d}".format(i + 1)
-        # split interval if necessary
-        for ivs in intervalindex.values():
-            for iv in ivs:
-                if interval and overlap and interval < len(iv):
-                    self += iv.tile(
-                        interval, overlap, len(f) > 3
-                    )  # name with suffix if named interval
-                else:
-                    self += [iv]
-        # add flanks
-        for e in self:
-            e.extend(flank)
+        # split interval if necessary and add flanks
+        intervals = IntervalArray.fromIntervals(
+            [iv for ivs in intervalindex.values() for iv in ivs]
+        )
+        if interval and overlap and len(intervals):
+            intervals = intervals.tile(
+                interval, overlap, len(f) > 3
+            )  # name with suffix if named interval
+        self += intervals.extend(flank).toIntervals()
         return
 
 
+"""interval from VCF fields"""
+
+
+def vcfInterval(f):
+    return Interval(
+        f[0],
+        int(f[1]),
+        int(f[1]) + max(map(len, [f[3]] + f[4].split(","))),
+        name=f[2] if f[2] != "." else None,
+        metadata=f[7],
+    )
+
+
+"""streaming vcf reader (header is skipped)"""
+
+
+def iterVCF(fi, interval=None, overlap=None, flank=0):
+    with open(fi) as fh:
+        for line in fh:
+            if not (line.startswith("#") or len(line.rstrip()) == 0):
+                yield vcfInterval(line.split()).extend(flank)
+
+
 """vcf parser with segment hashing and tiling"""
 
 
@@ -261,24 +326,16 @@ class VCF(IntervalList):  # no interval tiling as a variant has to be sequenced
                 if line.startswith("#CHROM"):
                     self.samples = line[1:].split()[9:]  # sample header
             else:
-                f = line.split()
-                iv = Interval(
-                    f[0],
-                    int(f[1]),
-                    int(f[1]) + max(map(len, [f[3]] + f[4].split(","))),
-                    name=f[2] if f[2] != "." else None,
-                    metadata=f[7],
-                )
-                self.append(iv)
+                self.append(vcfInterval(line.split()))
         # add flanks and name
         for e in self:
             e.extend(flank)
         return
 
     @classmethod
-    def create_stripped_vcf(cls, file_name, new_file_name):
+    def create_stripped_vcf(cls, file_name, new_file_name, threads=1):
         """Created stripped versions of VCF file from databases like GNOMAD that have chromosome files of tens of GBs"""
-        vcf_in = pysam.VariantFile(file_name)  # can be .vcf or, for instance .vcf.bgz
+        vcf_in = pysam.VariantFile(file_name, threads=threads)  # can be .vcf or, for instance .vcf.bgz
         new_header = pysam.libcbcf.VariantHeader()
         hc = vcf_in.header
         for mapping in (hc.filters, hc.formats):
@@ -291,7 +348,9 @@ class VCF(IntervalList):  # no interval tiling as a variant has to be sequenced
             new_header.add_sample(sample)
         for alt in hc.alts.values():
             new_header.add_alt(alt)
-        with pysam.VariantFile(new_file_name, "w", header=new_header) as vcf_out:
+        # bgzip compressed output (with htslib compression threads) if named as such
+        mode = "wz" if new_file_name.endswith(("gz", ".bgz")) else "w"
+        with pysam.VariantFile(new_file_name, mode, header=new_header, threads=threads) as vcf_out:
             recnewinfo = None
             for rec in vcf_in.fetch():
                 if recnewinfo is None:
@@ -321,7 +380,7 @@ class VCF(IntervalList):  # no interval tiling as a variant has to be sequenced
 
 
 class SNPpy(IntervalList):
-    def __init__(self, fh, flank=0, delim="\t", db=None):
+    def __init__(self, fh, flank=0, delim="\t", db=None, columns=None):
         IntervalList.__init__(self, [], source="VCF")
         self.header = []
         self.samples = []
@@ -333,7 +392,7 @@ class SNPpy(IntervalList):
                 commentcount += 1
             elif i - commentcount == 0:
                 self.header = line.rstrip().split(delim)
-                self.data = {h: [] for h in self.header}
+                self.data = {h: [] for h in self.header if columns is None or h in columns}
             elif re.match("^\s+$", line):
                 pass  # tabs/space only line
             else:
@@ -342,10 +401,11 @@ class SNPpy(IntervalList):
                     f = line.rstrip().split(delim)
                     row = dict(zip(self.header, f))
                     for k, v in row.items():
-                        try:
-                            self.data[k].append(v)
-                        except:
-                            raise Exception("UnknownColumn")
+                        if columns is None or k in columns:
+                            try:
+                                self.data[k].append(v)
+                            except:
+                                raise Exception("UnknownColumn")
                 except:
                     print(line, file=sys.stderr)
                     print(row, file=sys.stderr)
@@ -491,6 +551,26 @@ def readTargets(targets, tiling):
     return intervals
 
 
+"""reads targets in chunks of intervals (VCF and BED files are streamed)"""
+
+
+def iterTargets(targets, tiling, chunksize=10000):
+    if os.path.isfile(targets) and targets.endswith("vcf"):
+        intervals, source = iterVCF(targets, **tiling), "VCF"
+    elif os.path.isfile(targets) and targets.endswith("bed"):
+        intervals, source = iterBED(targets, **tiling), "BED"
+    else:
+        intervals, source = iter(readTargets(targets, tiling)), None
+    chunk = IntervalList([], source=source)
+    for iv in intervals:
+        chunk.append(iv)
+        if len(chunk) >= chunksize:
+            yield chunk
+            chunk = IntervalList([], source=source)
+    if chunk:
+        yield chunk
+
+
 """readBatch: read file from SNPpy result output"""
 
 
@@ -501,7 +581,7 @@ def readBatch(fi, tiling, database=None):
         print("ERROR: Not a readable file (%s)" % fi, file=sys.stderr)
         raise
     with open(fi) as fh:
-        intervals = SNPpy(fh, flank=tiling["flank"], db=database)
+        intervals = SNPpy(fh, flank=tiling["flank"], db=database, columns=["geneID"])
     sampleVariants = {}
     for iv in intervals:
         try:
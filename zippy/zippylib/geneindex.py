@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+__doc__ == """Byte offset index of gene symbols in GenePred annotation files"""
+__author__ = "David Brawand"
+__license__ = "MIT"
+__maintainer__ = "David Brawand"
+__email__ = "dbrawand@nhs.net"
+__status__ = "Production"
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+from collections import defaultdict
+
+INDEXVERSION = 1
+indexes = {}  # annotation -> GeneIndex
+
+
+def indexPath(annotation):
+    return annotation + ".genes.json"
+
+
+def sourceStamp(annotation):
+    st = os.stat(annotation)
+    return [st.st_size, st.st_mtime_ns]
+
+
+"""line offsets per gene symbol (lines without symbol and the last line are always read)"""
+
+
+def buildIndex(annotation):
+    genes, always = defaultdict(list), []
+    last, offset = None, 0
+    with open(annotation, "rb") as fh:
+        for iline, line in enumerate(fh):
+            if not (iline == 0 and line.startswith(b"track")) and not line.startswith(b"#"):
+                f = line.split()
+                if len(f) > 12:
+                    genes[f[12].decode("utf-8")].append(offset)
+                else:
+                    always.append(offset)
+                last = offset
+            offset += len(line)
+    if last is not None and last not in always:
+        always.append(last)  # GenePred tiling depends on the last line
+    index = {
+        "version": INDEXVERSION,
+        "source": annotation,
+        "stamp": sourceStamp(annotation),
+        "genes": genes,
+        "always": always,
+    }
+    try:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(annotation)), suffix=".tmp")
+        with os.fdopen(fd, "w") as fh:
+            json.dump(index, fh)
+        os.replace(tmp, indexPath(annotation))
+    except (IOError, OSError) as exc:
+        print("WARNING: could not write gene index ({})".format(exc), file=sys.stderr)
+    return GeneIndex(annotation, index)
+
+
+"""gene symbol index of annotation file"""
+
+
+class GeneIndex(object):
+    def __init__(self, annotation, index):
+        self.annotation = annotation
+        self.stamp = index["stamp"]
+        self.genes = index["genes"]
+        self.always = index["always"]
+
+    def __repr__(self):
+        return "<GeneIndex {} ({} genes)>".format(self.annotation, len(self.genes))
+
+    def lines(self, getgenes):
+        # annotation lines of genes (in file order)
+        offsets = set(self.always)
+        for gene in getgenes:
+            offsets.update(self.genes.get(gene, []))
+        with open(self.annotation, "rb") as fh:
+            for offset in sorted(offsets):
+                fh.seek(offset)
+                yield fh.readline().decode("utf-8")
+
+
+"""returns current gene index of annotation (rebuilt if missing or outdated)"""
+
+
+def geneIndex(annotation):
+    stamp = sourceStamp(annotation)
+    if annotation in indexes and indexes[annotation].stamp == stamp:
+        return indexes[annotation]
+    try:
+        with open(indexPath(annotation)) as fh:
+            index = json.load(fh)
+        assert index["version"] == INDEXVERSION and index["stamp"] == stamp
+    except (IOError, ValueError, KeyError, AssertionError):
+        indexes[annotation] = buildIndex(annotation)
+    else:
+        indexes[annotation] = GeneIndex(annotation, index)
+    return indexes[annotation]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds gene index of GenePred annotation")
+    parser.add_argument("annotation", help="GenePred file (refGene)")
+    args = parser.parse_args()
+    print(buildIndex(args.annotation), file=sys.stderr)
@@ -1,4 +1,5 @@
-import subprocess, argparse, sys, re, os, logging, shutil, gzip
+import subprocess, argparse, sys, re, os, logging, shutil, gzip, json, multiprocessing
+import pysam
 from . import files
 logger = logging.getLogger(__name__)
 
@@ -55,6 +56,46 @@ class GnomadChromosomeInfo:
             #                              self.stripped_file_fullpath)
         #self.compress_data(resources_folder, deambiguate=False)
         #self.test_compressed_data(resources_folder)
+    def checkpoint_file(self):
+        return self.stripped_file_fullpath + ".done"
+
+    def source_stamp(self):
+        st = os.stat(self.file_fullpath)
+        return [st.st_size, st.st_mtime_ns]
+
+    def is_stripped(self):
+        # checkpoint of completed chromosome (matching source file)
+        try:
+            with open(self.checkpoint_file()) as fh:
+                stamp = json.load(fh)["source"]
+        except (IOError, ValueError, KeyError):
+            return False
+        return (
+            stamp == self.source_stamp()
+            and os.path.exists(self.stripped_file_fullpath)
+            and os.path.exists(self.stripped_index_file_txt_fullpath)
+        )
+
+    def strip_data(self, threads=1):
+        # strip to temporary file, index and move into place (interrupted runs leave no partial output)
+        if self.is_stripped():
+            logger.info(f"File {self.stripped_file_fullpath} already stripped")
+            return False
+        partial = self.stripped_file_fullpath[: -len(".vcf.bgz")] + ".partial.vcf.bgz"
+        try:
+            files.VCF.create_stripped_vcf(self.file_fullpath, partial, threads=threads)
+            pysam.tabix_index(partial, preset="vcf", force=True)
+        except BaseException:
+            for fi in (partial, partial + ".tbi"):
+                if os.path.exists(fi):
+                    os.remove(fi)
+            raise
+        os.replace(partial + ".tbi", self.stripped_index_file_txt_fullpath)
+        os.replace(partial, self.stripped_file_fullpath)
+        with open(self.checkpoint_file(), "w") as fh:
+            json.dump({"source": self.source_stamp()}, fh)
+        return True
+
     def compress_data(self, resources_folder, deambiguate=False):
         if deambiguate:
             shutil.move(self.stripped_file_fullpath, self.stripped_file_fullpath_txt)
@@ -93,6 +134,24 @@ def get_files(gnomad_version, info_type, resources_folder):
     return chromosomes_infos
 
 
+def strip_chromosome(job):
+    chromobj, threads = job
+    stripped = chromobj.strip_data(threads)
+    return chromobj.chromosome_id, stripped
+
+
+def strip_files(chromosomes_infos, processes=1, threads=1):
+    # strip chromosomes concurrently (resumes from checkpoints)
+    jobs = [
+        (chromobj, threads)
+        for chromobj in chromosomes_infos.values()
+        if os.path.exists(chromobj.file_fullpath)
+    ]
+    with multiprocessing.Pool(max(1, min(processes, len(jobs)))) as pool:
+        for chromid, stripped in pool.imap_unordered(strip_chromosome, jobs):
+            logger.info(f"Chromosome {chromid} {'stripped' if stripped else 'skipped'}")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-v", "--version", default="2.1.1")
@@ -100,5 +159,10 @@ if __name__ == "__main__":
     parser.add_argument("-u", "--user_and_group_string", default=None, type=str)
     parser.add_argument("-z", "--zippypath", default="/usr/local/zippy", type=str)
     parser.add_argument("-t", "--zippytmp", default="/tmp/zippy", type=str)
+    parser.add_argument("-p", "--processes", default=1, type=int, help="chromosomes stripped in parallel")
+    parser.add_argument("--threads", default=2, type=int, help="htslib threads per chromosome")
+    parser.add_argument("--strip", action="store_true", help="strip downloaded files (AF only) and index")
     args = parser.parse_args()
-    get_files(args.version, "genomes", args.resources_folder)
+    chromosomes_infos = get_files(args.version, "genomes", args.resources_folder)
+    if args.strip:
+        strip_files(chromosomes_infos, args.processes, args.threads)
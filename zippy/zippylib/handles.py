@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+__doc__ == """Shared file handles"""
+__author__ = "David Brawand"
+__license__ = "MIT"
+__maintainer__ = "David Brawand"
+__email__ = "dbrawand@nhs.net"
+__status__ = "Production"
+
+import os
+import atexit
+import threading
+import pysam
+
+
+"""process-wide registry of open file handles keyed by path (dropped in forked children)"""
+
+
+class HandleRegistry(object):
+    def __init__(self, opener):
+        self.opener = opener
+        self.handles = {}  # path -> (file stamp, handle)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.handles)
+
+    def get(self, path):
+        try:
+            return self.handles[path][1]  # file changes are picked up by refresh
+        except KeyError:
+            pass
+        with self.lock:
+            if path not in self.handles:
+                st = os.stat(path)
+                self.handles[path] = ((st.st_mtime_ns, st.st_size), self.opener(path))
+            return self.handles[path][1]
+
+    def refresh(self):
+        # drop handles of replaced or changed files (reopened by next get)
+        with self.lock:
+            for path, (stamp, handle) in list(self.handles.items()):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    self.release(path)
+                    continue
+                if (st.st_mtime_ns, st.st_size) != stamp:
+                    self.release(path)
+
+    def release(self, path):
+        try:
+            handle = self.handles.pop(path)[1]
+        except KeyError:
+            return
+        handle.close()
+
+    def close(self):
+        for path in list(self.handles.keys()):
+            self.release(path)
+
+    def forget(self):
+        # child process after fork (htslib state and file offsets are shared with parent)
+        self.handles = {}
+        self.lock = threading.Lock()
+
+
+fastafiles = HandleRegistry(pysam.FastaFile)
+tabixfiles = HandleRegistry(pysam.TabixFile)
+
+registries = [fastafiles, tabixfiles]
+
+
+def fastaFile(path):
+    return fastafiles.get(path)
+
+
+def tabixFile(path):
+    return tabixfiles.get(path)
+
+
+def closeAll():
+    for registry in registries:
+        registry.close()
+
+
+def refreshAll():
+    for registry in registries:
+        registry.refresh()
+
+
+def forgetAll():
+    for registry in registries:
+        registry.forget()
+
+
+atexit.register(closeAll)
+os.register_at_fork(after_in_child=forgetAll)
@@ -11,10 +11,25 @@ __email__ = "dbrawand@nhs.net"
 __status__ = "Production"
 
 import sys
+import numpy as np
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
 from math import ceil
 
 
 class Interval(object):
+    __slots__ = (
+        "chrom",
+        "chromStart",
+        "chromEnd",
+        "name",
+        "strand",
+        "sample",
+        "_subintervals",
+        "_metadata",
+        "_metadata_dict",
+    )
+
     def __init__(
         self, chrom, chromStart, chromEnd, name=None, reverse=None, sample=None, metadata=None
     ):
@@ -29,12 +44,31 @@ class Interval(object):
         # self.exon_starts = exon_starts
         # self.exon_ends = exon_ends
         # self.gene_name = gene_name
-        self.subintervals = IntervalList([])
-        if metadata is None:
-            self.metadata = None
-        else:
-            self.metadata_dict = {}
-            self.metadata = metadata.split(";")
+        self._subintervals = None  # created on first use
+        self._metadata = metadata  # parsed on first use
+        self._metadata_dict = None
+        return
+
+    @property
+    def subintervals(self):
+        if self._subintervals is None:
+            self._subintervals = IntervalList([])
+        return self._subintervals
+
+    @subintervals.setter
+    def subintervals(self, value):
+        self._subintervals = value
+
+    @property
+    def metadata(self):
+        if isinstance(self._metadata, str):
+            self._metadata = self._metadata.split(";")
+        return self._metadata
+
+    @property
+    def metadata_dict(self):
+        if self._metadata_dict is None and self.metadata is not None:
+            self._metadata_dict = {}
             for attribute in self.metadata:
                 attrparts = attribute.split("=")
                 if len(attrparts) == 1:
@@ -43,10 +77,10 @@ class Interval(object):
                     # self.metadata[None] = attrparts[0]
                 elif len(attrparts) == 2:
                     assert attrparts[0] not in self.metadata
-                    self.metadata_dict[attrparts[0]] = attrparts[1]
+                    self._metadata_dict[attrparts[0]] = attrparts[1]
                 else:
                     assert 0, attrparts
-        return
+        return self._metadata_dict
 
     def name_by_range(self):
         return self.chrom + ":" + str(self.chromStart) + "-" + str(self.chromEnd)
@@ -58,14 +92,19 @@ class Interval(object):
         """returns interval of variant"""
         return (self.chrom, self.chromStart, self.chromEnd)
 
+    def key(self):
+        return (self.chrom, self.chromStart, self.chromEnd, self.name)
+
     def __hash__(self):
-        return hash(str(self))
+        return hash(self.key())
 
     def __len__(self):
         return self.chromEnd - self.chromStart
 
     def __eq__(self, other):
-        return hash(self) == hash(other)
+        if not isinstance(other, Interval):
+            return NotImplemented
+        return self.key() == other.key()
 
     def __lt__(self, other):
         return (self.chrom, self.chromStart, self.chromEnd) < (
@@ -126,7 +165,7 @@ class Interval(object):
             )
             self.chromEnd = other.chromEnd if other.chromEnd > self.chromEnd else self.chromEnd
             self.name = self.name if other.name == self.name else self.name + "_" + other.name
-            if subintervals and (self.subintervals or other.subintervals):
+            if subintervals and (self._subintervals or other._subintervals):
                 self.subintervals += other.subintervals
                 self.flattenSubintervals()
 
@@ -142,7 +181,7 @@ class Interval(object):
                     self.name = self.name_by_range()
                 else:
                     self.name + "_U_" + other.name
-            if subintervals and (self.subintervals or other.subintervals):
+            if subintervals and (self._subintervals or other._subintervals):
                 self.subintervals += other.subintervals
                 self.unionSubintervals()
 
@@ -191,3 +230,287 @@ class IntervalList(list):
 
     def __repr__(self):
         return "<IntervalList (%s) %d elements> " % (self.source, len(self))
+
+
+"""columnar interval container (chromosome codes, starts, ends, strands, names) with vectorized operations"""
+
+
+class IntervalArray(object):
+    def __init__(self, chroms, chrom, start, end, strand, names):
+        self.chroms = list(chroms)  # chromosome names (by code)
+        self.chrom = np.asarray(chrom, dtype=np.int32)
+        self.start = np.asarray(start, dtype=np.int64)
+        self.end = np.asarray(end, dtype=np.int64)
+        self.strand = np.asarray(strand, dtype=np.int8)
+        self.names = np.empty(len(names), dtype=object)
+        self.names[:] = names
+
+    def __len__(self):
+        return len(self.start)
+
+    def __repr__(self):
+        return "<IntervalArray %d elements (%d chromosomes)>" % (len(self), len(self.chroms))
+
+    @classmethod
+    def fromIntervals(cls, intervals):
+        intervals = list(intervals)
+        codes = {}
+        for iv in intervals:
+            codes.setdefault(iv.chrom, len(codes))
+        return cls(
+            list(codes.keys()),
+            [codes[iv.chrom] for iv in intervals],
+            [iv.chromStart for iv in intervals],
+            [iv.chromEnd for iv in intervals],
+            [iv.strand for iv in intervals],
+            [iv.name for iv in intervals],
+        )
+
+    def toIntervals(self, source=None):
+        return IntervalList(
+            [
+                Interval(self.chroms[c], s, e, n, None if d == 0 else d < 0)
+                for c, s, e, d, n in zip(
+                    self.chrom.tolist(),
+                    self.start.tolist(),
+                    self.end.tolist(),
+                    self.strand.tolist(),
+                    self.names,
+                )
+            ],
+            source=source,
+        )
+
+    def __iter__(self):
+        return iter(self.toIntervals())
+
+    def extend(self, flank):
+        """adds flanks (as Interval.extend)"""
+        self.start = np.where(flank <= self.start, self.start - flank, 0)
+        self.end = self.end + flank
+        return self
+
+    def tile(self, i, o, suffix=True):
+        """splits intervals longer than i into overlapping tiles (as Interval.tile)"""
+        length = self.end - self.start
+        tiled = length > i
+        # tile number and optimal tile size (untiled intervals are a single tile)
+        n = np.where(tiled, np.ceil((length - o) / float(i - o)), 1).astype(np.int64)
+        size = np.where(tiled, np.ceil((length + n * o - o) / n.astype(float)), length)
+        size = size.astype(np.int64)
+        step = np.where(tiled, size - o, 1)
+        count = np.minimum(
+            np.ceil(np.maximum(length - size, 0) / step.astype(float)) + 1,
+            np.maximum(np.ceil(length / step.astype(float)), 1),
+        ).astype(np.int64)
+        rows = np.repeat(np.arange(len(self)), count)
+        k = np.arange(len(rows)) - np.repeat(np.cumsum(count) - count, count)
+        start = self.start[rows] + k * step[rows]
+        end = np.minimum(start + size[rows], self.end[rows])
+        number = np.where(self.strand[rows] < 0, count[rows] - k, k + 1)
+        strand = np.where(tiled[rows], np.where(self.strand[rows] < 0, -1, 1), self.strand[rows])
+        names = [
+            self.names[r]
+            if not tiled[r]
+            else self.names[r] + "_" + str(t)
+            if suffix
+            else self.chroms[c] + ":" + str(s) + "-" + str(e)
+            for r, t, c, s, e in zip(
+                rows.tolist(),
+                number.tolist(),
+                self.chrom[rows].tolist(),
+                start.tolist(),
+                end.tolist(),
+            )
+        ]
+        return IntervalArray(self.chroms, self.chrom[rows], start, end, strand, names)
+
+    def overlaps(self, other):
+        """index pairs (self, other) of overlapping intervals (bookended intervals overlap)"""
+        left, right = [], []
+        codes = {c: k for k, c in enumerate(other.chroms)}
+        for code, chrom in enumerate(self.chroms):
+            if chrom not in codes:
+                continue
+            rows = np.flatnonzero(self.chrom == code)
+            orows = np.flatnonzero(other.chrom == codes[chrom])
+            if not len(rows) or not len(orows):
+                continue
+            orows = orows[np.argsort(other.start[orows], kind="stable")]
+            ostart, oend = other.start[orows], other.end[orows]
+            maxlength = int((oend - ostart).max())
+            lo = np.searchsorted(ostart, self.start[rows] - maxlength, side="left")
+            hi = np.searchsorted(ostart, self.end[rows], side="right")
+            i = np.repeat(rows, hi - lo)
+            j = np.arange(len(i)) - np.repeat(np.cumsum(hi - lo) - (hi - lo), hi - lo)
+            j = np.repeat(lo, hi - lo) + j
+            hit = oend[j] >= self.start[i]
+            left.append(i[hit])
+            right.append(orows[j[hit]])
+        if not left:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        i, j = np.concatenate(left), np.concatenate(right)
+        order = np.lexsort((j, i))
+        return i[order], j[order]
+
+
+"""index pairs of overlapping intervals of two lists (sorted join, ordered by first then second list)"""
+
+
+def overlapJoin(a, b):
+    i, j = IntervalArray.fromIntervals(a).overlaps(IntervalArray.fromIntervals(b))
+    return list(zip(i.tolist(), j.tolist()))
+
+
+"""intersects intervals with loci (overlapping intervals are narrowed to each locus in turn)"""
+
+
+def intersectIntervals(loci, intervals):
+    intersected = []
+    for i, j in overlapJoin(loci, intervals):
+        # narrowed intervals only overlap a subset of the joined pairs
+        if loci[i].overlap(intervals[j]):
+            intervals[j].union_with(loci[i])
+            intersected.append(intervals[j])
+    return intersected
+
+
+"""overlap index of intervals (sorted starts per chromosome, bookended intervals overlap)"""
+
+
+class IntervalIndex(object):
+    def __init__(self, intervals):
+        self.intervals = list(intervals)
+        entries = defaultdict(list)
+        for i, iv in enumerate(self.intervals):
+            entries[iv.chrom].append((iv.chromStart, iv.chromEnd, i))
+        self.entries, self.starts, self.maxlength = {}, {}, {}
+        for chrom, chromentries in entries.items():
+            chromentries.sort()
+            self.entries[chrom] = chromentries
+            self.starts[chrom] = [e[0] for e in chromentries]
+            self.maxlength[chrom] = max(e[1] - e[0] for e in chromentries)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def __repr__(self):
+        return "<IntervalIndex %d elements (%d chromosomes)>" % (len(self), len(self.entries))
+
+    def __iter__(self):
+        return iter(self.intervals)
+
+    def find(self, chrom, start, end):
+        """indices of intervals overlapping chrom:start-end (in input order)"""
+        try:
+            starts = self.starts[chrom]
+        except KeyError:
+            return []
+        i = bisect_left(starts, start - self.maxlength[chrom])
+        j = bisect_right(starts, end)
+        return sorted(e[2] for e in self.entries[chrom][i:j] if e[1] >= start)
+
+    def overlapping(self, chrom, start, end):
+        return [self.intervals[i] for i in self.find(chrom, start, end)]
+
+    def first(self, others):
+        """first interval (in input order) overlapping any of the other intervals"""
+        hits = [
+            i
+            for other in others
+            for i in self.find(other.chrom, other.chromStart, other.chromEnd)[:1]
+        ]
+        return self.intervals[min(hits)] if hits else None
+
+
+"""read-only memory mapped interval store (IntervalIndex queries, shared by processes)"""
+
+
+class IntervalStore(object):
+    def __init__(self, path):
+        self.path = path
+        self.rows = np.load(path, mmap_mode="r")  # sorted by chrom and start
+        chroms, first = np.unique(self.rows["chrom"], return_index=True)
+        bounds = list(first) + [len(self.rows)]
+        self.ranges = {
+            c.decode("utf-8"): (int(i), int(bounds[k + 1]))
+            for k, (c, i) in enumerate(zip(chroms, first))
+        }
+        self.maxlength = {
+            c: int((self.rows["end"][i:j] - self.rows["start"][i:j]).max())
+            for c, (i, j) in self.ranges.items()
+        }
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return "<IntervalStore %s %d elements (%d chromosomes)>" % (
+            self.path,
+            len(self),
+            len(self.ranges),
+        )
+
+    def __iter__(self):
+        for row in np.argsort(self.rows["order"]):
+            yield self.interval(row)
+
+    def interval(self, row):
+        r = self.rows[row]
+        return Interval(
+            r["chrom"].decode("utf-8"),
+            int(r["start"]),
+            int(r["end"]),
+            r["name"].decode("utf-8"),
+            None if r["strand"] == 0 else bool(r["strand"] < 0),
+        )
+
+    def find(self, chrom, start, end):
+        """rows of intervals overlapping chrom:start-end (in input order)"""
+        try:
+            i, j = self.ranges[chrom]
+        except KeyError:
+            return []
+        starts = self.rows["start"][i:j]
+        a = int(np.searchsorted(starts, start - self.maxlength[chrom], side="left"))
+        b = int(np.searchsorted(starts, end, side="right"))
+        rows = np.arange(i + a, i + b)[self.rows["end"][i + a : i + b] >= start]
+        return list(rows[np.argsort(self.rows["order"][rows], kind="stable")])
+
+    def overlapping(self, chrom, start, end):
+        return [self.interval(row) for row in self.find(chrom, start, end)]
+
+    def first(self, others):
+        """first interval (in input order) overlapping any of the other intervals"""
+        hits = [
+            row
+            for other in others
+            for row in self.find(other.chrom, other.chromStart, other.chromEnd)[:1]
+        ]
+        if not hits:
+            return None
+        return self.interval(min(hits, key=lambda row: self.rows["order"][row]))
+
+    @staticmethod
+    def write(path, intervals):
+        """writes intervals to store file"""
+        intervals = list(intervals)
+        encode = lambda x: x.encode("utf-8")
+        dtype = [
+            ("chrom", "S%d" % max([len(encode(iv.chrom)) for iv in intervals] + [1])),
+            ("start", "i8"),
+            ("end", "i8"),
+            ("strand", "i1"),
+            ("order", "i8"),
+            ("name", "S%d" % max([len(encode(iv.name)) for iv in intervals] + [1])),
+        ]
+        rows = np.array(
+            [
+                (encode(iv.chrom), iv.chromStart, iv.chromEnd, iv.strand, i, encode(iv.name))
+                for i, iv in enumerate(intervals)
+            ],
+            dtype=dtype,
+        )
+        rows.sort(order=["chrom", "start", "order"])
+        with open(path, "wb") as fh:
+            np.save(fh, rows)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+__doc__ == """Memory mapped k-mer index for primer specificity checks"""
+__author__ = "David Brawand"
+__license__ = "MIT"
+__maintainer__ = "David Brawand"
+__email__ = "dbrawand@nhs.net"
+__status__ = "Production"
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pysam
+from numpy.lib.format import open_memmap
+from . import ConfigError
+from .primer import Aligner, bindingTm
+
+INDEXVERSION = 1
+BASES = "ACGTN"
+ENCODE = np.full(256, 4, dtype=np.uint8)
+for i, b in enumerate("ACGT"):
+    ENCODE[ord(b)] = ENCODE[ord(b.lower())] = i
+
+
+def encode(seq):
+    return ENCODE[np.frombuffer(seq.encode("ascii"), dtype=np.uint8)]
+
+
+def kmerCodes(seq, k):
+    # rolling 2-bit codes of all k-mers, k-mers with N are invalid
+    n = len(seq) - k + 1
+    codes = np.zeros(max(n, 0), dtype=np.int64)
+    valid = np.ones(max(n, 0), dtype=bool)
+    for j in range(k):
+        c = seq[j : j + n]
+        codes = codes * 4 + (c & 3)
+        valid &= c < 4
+    return codes, valid
+
+
+"""builds k-mer index of genome (concatenated sequence, bucket offsets and sorted positions)"""
+
+
+def buildIndex(genome, path, k=8, chunksize=2 ** 24):
+    os.makedirs(path, exist_ok=True)
+    fasta = pysam.FastaFile(genome)
+    chroms, lengths = list(fasta.references), list(fasta.lengths)
+    starts = [int(x) for x in np.cumsum([0] + [l + 1 for l in lengths[:-1]])]  # N separated
+    total = sum(lengths) + len(lengths) - 1
+    # encoded genome
+    seq = open_memmap(os.path.join(path, "seq.npy"), mode="w+", dtype=np.uint8, shape=(total,))
+    seq[:] = 4
+    for chrom, start, length in zip(chroms, starts, lengths):
+        for i in range(0, length, chunksize):
+            s = fasta.fetch(chrom, i, min(i + chunksize, length))
+            seq[start + i : start + i + len(s)] = encode(s)
+        print("Encoded {} ({}bp)".format(chrom, length), file=sys.stderr)
+    fasta.close()
+    # count k-mers (bucket offsets)
+    counts = np.zeros(4 ** k, dtype=np.int64)
+    for i in range(0, total - k + 1, chunksize):
+        codes, valid = kmerCodes(seq[i : min(i + chunksize + k - 1, total)], k)
+        counts += np.bincount(codes[valid], minlength=4 ** k)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+    # fill positions (counting sort, chunks are in genome order so buckets stay sorted)
+    positions = open_memmap(
+        os.path.join(path, "positions.npy"),
+        mode="w+",
+        dtype=np.uint32 if total < 2 ** 32 else np.uint64,
+        shape=(int(offsets[-1]),),
+    )
+    cursor = offsets[:-1].copy()
+    for i in range(0, total - k + 1, chunksize):
+        codes, valid = kmerCodes(seq[i : min(i + chunksize + k - 1, total)], k)
+        pos = np.flatnonzero(valid) + i
+        codes = codes[valid]
+        order = np.argsort(codes, kind="stable")
+        codes, pos = codes[order], pos[order]
+        rank = np.arange(len(codes)) - np.searchsorted(codes, codes)
+        positions[cursor[codes] + rank] = pos
+        cursor += np.bincount(codes, minlength=4 ** k)
+    positions.flush()
+    seq.flush()
+    with open(os.path.join(path, "index.json"), "w") as fh:
+        json.dump(
+            {
+                "version": INDEXVERSION,
+                "genome": os.path.abspath(genome),
+                "k": k,
+                "chroms": chroms,
+                "starts": starts,
+                "lengths": lengths,
+            },
+            fh,
+            indent=4,
+        )
+    return KmerIndex(path)
+
+
+"""memory mapped k-mer index (finds primer binding sites with up to one mismatch)"""
+
+
+class KmerIndex(object):
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as fh:
+            meta = json.load(fh)
+        if meta["version"] != INDEXVERSION:
+            raise Exception("KmerIndexVersionError")
+        self.k = meta["k"]
+        self.chroms = meta["chroms"]
+        self.starts = np.array(meta["starts"], dtype=np.int64)
+        self.ends = self.starts + np.array(meta["lengths"], dtype=np.int64)
+        self.seq = np.load(os.path.join(path, "seq.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.positions = np.load(os.path.join(path, "positions.npy"), mmap_mode="r")
+
+    def __repr__(self):
+        return "<KmerIndex {} (k={}, {} sequences)>".format(self.path, self.k, len(self.chroms))
+
+    def sites(self, seq):
+        # returns [(mismatches, chromindex, position, reverse, sequence)]
+        if len(seq) < 2 * self.k:
+            # fewer than two disjoint seeds miss sites with one mismatch
+            raise ValueError("query shorter than 2k ({} < {})".format(len(seq), 2 * self.k))
+        found = []
+        rc = seq.upper().translate(str.maketrans("ACGTN", "TGCAN"))[::-1]
+        for reverse, qry in enumerate([seq.upper(), rc]):
+            q = encode(qry)
+            if (q > 3).any():
+                continue
+            # seed with the two least frequent disjoint k-mers (one is exact if <=1 mismatch)
+            tiles = []
+            for t in range(0, len(q) - self.k + 1, self.k):
+                code = int(kmerCodes(q[t : t + self.k], self.k)[0][0])
+                tiles.append((int(self.offsets[code + 1] - self.offsets[code]), t, code))
+            candidates = []
+            for size, t, code in sorted(tiles)[:2]:
+                hits = self.positions[self.offsets[code] : self.offsets[code + 1]]
+                candidates.append(hits.astype(np.int64) - t)
+            candidates = np.unique(np.concatenate(candidates))
+            candidates = candidates[(candidates >= 0) & (candidates + len(q) <= len(self.seq))]
+            if not len(candidates):
+                continue
+            # verify and stay within sequence boundaries
+            windows = self.seq[candidates[:, None] + np.arange(len(q))]
+            mismatches = (windows != q).sum(axis=1)
+            chromindex = np.searchsorted(self.starts, candidates, side="right") - 1
+            keep = (mismatches <= 1) & (candidates + len(q) <= self.ends[chromindex])
+            for m, c, p, w in zip(
+                mismatches[keep], chromindex[keep], candidates[keep], windows[keep]
+            ):
+                ref = "".join(BASES[x] for x in w)
+                found.append((int(m), int(c), int(p - self.starts[c]), bool(reverse), qry, ref))
+        return sorted(found)
+
+    def place(self, seq, tmThreshold=50.0, endMatch=6, maxAln=20):
+        # best sites (as bowtie -k), then same Tm and 3' end rules as alignment filter
+        placements = []
+        for mismatches, c, pos, reverse, qry, ref in self.sites(seq)[:maxAln]:
+            tm = bindingTm(qry, ref, tmThreshold, endMatch)
+            if tm is not None:
+                placements.append((self.chroms[c], pos, reverse, tm))
+        # remove primer locations for those that have hit maximum
+        return placements if len(placements) < maxAln else []
+
+
+"""aligner using k-mer index instead of bowtie (same interface, placements cached by sequence)"""
+
+
+class KmerAligner(Aligner):
+    def __init__(self, path, tmThreshold=50.0, endMatch=6, maxAln=20, minLength=None):
+        Aligner.__init__(
+            self, path, tmThreshold=tmThreshold, endMatch=endMatch, maxAln=maxAln
+        )
+        self.index = KmerIndex(path)
+        if minLength is not None and minLength < 2 * self.index.k:
+            raise ConfigError(
+                "k-mer index {} (k={}) requires primers of at least {}bp (PRIMER_MIN_SIZE {})".format(
+                    path, self.index.k, 2 * self.index.k, minLength
+                )
+            )
+
+    def search(self, seqs):
+        return {
+            s: self.index.place(s, self.tmThreshold, self.endMatch, self.maxAln) for s in seqs
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds k-mer index for primer specificity")
+    parser.add_argument("genome", help="Genome FASTA (faidx indexed)")
+    parser.add_argument("index", help="Index directory")
+    parser.add_argument("-k", dest="k", type=int, default=8, help="k-mer size [8]")
+    args = parser.parse_args()
+    print(buildIndex(args.genome, args.index, args.k), file=sys.stderr)
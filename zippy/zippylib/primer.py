@@ -18,9 +18,13 @@ from hashlib import md5, sha1
 import primer3
 import pysam
 import subprocess
+import threading
 from collections import defaultdict, OrderedDict, Counter
+from copy import deepcopy
 from .interval import Interval
-from . import gnomad
+from . import gnomad, thermo
+from .handles import fastaFile, fastafiles, tabixFile
+from .snpindex import snpIndex, snpSource, vcfEnd
 from urllib.parse import unquote
 from Bio import Entrez
 
@@ -85,14 +89,13 @@ class Genome(object):
         chromEnd = (
             locus.offset - ampsize[0] if locus.reverse else locus.offset + locus.length + ampsize[1]
         )
-        with pysam.FastaFile(self.file) as fasta:
-            seqslice = fasta.fetch(locus.chrom, chromStart, chromEnd)
+        seqslice = fastaFile(self.file).fetch(locus.chrom, chromStart, chromEnd)
         # find sequence
         qrySeq = seq if locus.reverse else seq.translate(revcmp)[::-1]
         # create new loci
         loci = []
         for i in [match.start() for match in re.finditer(re.escape(qrySeq), seqslice)]:
-            tm = primer3.calcTm(qrySeq)
+            tm = thermo.calcTm(qrySeq)
             loci.append(Locus(locus.chrom, chromStart + i, len(qrySeq), not locus.reverse, tm))
         return loci
 
@@ -104,96 +107,212 @@ class MultiFasta(object):
     def __init__(self, fi):
         self.file = fi
         # check sequence uniqueness
-        with pysam.FastaFile(self.file) as fasta:
-            self.references = fasta.references
-            if len(set(fasta.references)) != len(fasta.references):
-                print(self.file, file=sys.stderr)
-                raise Exception("DuplicateSequenceNames")
+        fasta = fastaFile(self.file)
+        self.references = fasta.references
+        if len(set(fasta.references)) != len(fasta.references):
+            print(self.file, file=sys.stderr)
+            raise Exception("DuplicateSequenceNames")
+
+    def close(self):
+        fastafiles.release(self.file)
 
     def createPrimers(
         self, db, bowtie="bowtie2", delete=True, tags={}, tmThreshold=50.0, endMatch=6, maxAln=20
     ):
-        # run bowtie (max 1000 alignments, allow for one gap/mismatch?)
-        mapfile = self.file + ".sam"
-        if not os.path.exists(mapfile):
-            proc = subprocess.check_call(
-                [
-                    bowtie,
-                    "-f",
-                    "--end-to-end",
-                    "-p 2",
-                    "-k " + str(maxAln),
-                    "-L 10",
-                    "-N 1",
-                    "-D 20",
-                    "-R 3",
-                    "-x",
-                    db,
-                    "-U",
-                    self.file,
-                    ">",
-                    mapfile,
-                ]
-            )
+        # NB: delete kept for compatibility (alignments are streamed, no mapping file written)
         # Read fasta file (Create Primer)
         primers = {}
-        with pysam.FastaFile(self.file) as fasta:
-            for s in fasta.references:
-                # parse target locus from fasta file
-                try:
-                    primername, targetposition = s.split("|")
-                    reTargetposition = re.match(r"(\w+):(\d+)-(\d+):([+-])", targetposition)
-                except:
-                    primername = s
-                    targetLocus = None
-                else:
-                    # create stranded targetlocus
-                    reverse = True if reTargetposition.group(4) == "-" else False
-                    tm = primer3.calcTm(fasta.fetch(s))  # assume targetlocus is full match
-                    targetLocus = Locus(
-                        reTargetposition.group(1),
-                        int(reTargetposition.group(2)),
-                        int(reTargetposition.group(3)) - int(reTargetposition.group(2)),
-                        reverse,
-                        tm,
-                    )
-                # create primer (with target locus)
-                primertag = tags[primername] if primername in tags.keys() else None
-                primers[primername] = Primer(primername, fasta.fetch(s), targetLocus, tag=primertag)
-
-        # read SAM OUTPUT and filter alignments
-        mappings = pysam.Samfile(mapfile, "r")
-        alnCount = (
-            Counter()
-        )  # count alignments to kill locations of non-specific primers (count == -k)
-        for aln in mappings:
-            primername = aln.qname.split("|")[0]
-            if aln.is_unmapped:
-                continue
+        fasta = fastaFile(self.file)
+        for s in fasta.references:
+            # parse target locus from fasta file
+            try:
+                primername, targetposition = s.split("|")
+                reTargetposition = re.match(r"(\w+):(\d+)-(\d+):([+-])", targetposition)
+            except:
+                primername = s
+                targetLocus = None
             else:
-                alnCount[primername] += 1
-            # get reference sequence
-            qry = aln.query_sequence.upper()
-            ref = aln.get_reference_sequence().upper()
-            refrc = ref.translate(revcmp)[::-1]
-            aln_tm = primer3.calcHeterodimerTm(qry, refrc)
-            # TmThreshold and mimatches in 3'end check
-            if aln_tm > tmThreshold:
-                if len(qry) > endMatch and len(ref) > endMatch:
-                    if len([x for x in zip(qry[-endMatch:], ref[-endMatch:]) if x[0] != x[1]]) == 0:
-                        primers[primername].addTarget(
-                            mappings.getrname(aln.reference_id), aln.pos, aln.is_reverse, aln_tm
-                        )
-        # remove primer locations for those that have hit maximum
-        for k, v in primers.items():
-            if len(v.loci) >= maxAln:
-                v.loci = []
-        # cleanup
-        if delete:
-            os.unlink(self.file + ".sam")  # delete mapping FILE
+                # create stranded targetlocus
+                reverse = True if reTargetposition.group(4) == "-" else False
+                tm = thermo.calcTm(fasta.fetch(s))  # assume targetlocus is full match
+                targetLocus = Locus(
+                    reTargetposition.group(1),
+                    int(reTargetposition.group(2)),
+                    int(reTargetposition.group(3)) - int(reTargetposition.group(2)),
+                    reverse,
+                    tm,
+                )
+            # create primer (with target locus)
+            primertag = tags[primername] if primername in tags.keys() else None
+            primers[primername] = Primer(primername, fasta.fetch(s), targetLocus, tag=primertag)
+
+        # run bowtie (max 1000 alignments, allow for one gap/mismatch?) and filter alignments
+        placements = streamAlignments(
+            bowtieCommand(db, self.file, bowtie, maxAln=maxAln),
+            lambda x: x.split("|")[0],
+            None,
+            tmThreshold,
+            endMatch,
+            maxAln,
+        )
+        for primername, loci in placements.items():
+            for locus in loci:
+                primers[primername].addTarget(*locus)
         return list(primers.values())
 
 
+"""Tm of aligned primer if it can prime (3' end match and TmThreshold), None otherwise"""
+
+
+def bindingTm(qry, ref, tmThreshold=50.0, endMatch=6):
+    # mimatches in 3'end check (before costly Tm calculation)
+    if len(qry) <= endMatch or len(ref) <= endMatch:
+        return None
+    if len([x for x in zip(qry[-endMatch:], ref[-endMatch:]) if x[0] != x[1]]) != 0:
+        return None
+    # TmThreshold
+    refrc = ref.translate(revcmp)[::-1]
+    aln_tm = thermo.calcHeterodimerTm(qry, refrc)
+    return aln_tm if aln_tm > tmThreshold else None
+
+
+"""filters bowtie alignments on Tm and 3' end match (returns key -> [(chrom,pos,reverse,tm)])"""
+
+
+def filterAlignments(mappings, key, tmThreshold=50.0, endMatch=6, maxAln=20):
+    placements = defaultdict(list)
+    nonspecific = set()  # primers that hit maximum (discarded as they stream in)
+    for aln in mappings:
+        if aln.is_unmapped:
+            continue
+        k = key(aln.query_name)
+        if k in nonspecific:
+            continue
+        # get reference sequence
+        qry = aln.query_sequence.upper()
+        ref = aln.get_reference_sequence().upper()
+        aln_tm = bindingTm(qry, ref, tmThreshold, endMatch)
+        if aln_tm is not None:
+            chrom = mappings.get_reference_name(aln.reference_id)
+            placements[k].append((chrom, aln.pos, aln.is_reverse, aln_tm))
+            # remove primer locations for those that have hit maximum
+            if len(placements[k]) >= maxAln:
+                nonspecific.add(k)
+                placements[k] = []
+    return placements
+
+
+"""bowtie command line (reads from file or stdin, SAM to stdout)"""
+
+
+def bowtieCommand(db, reads="-", bowtie="bowtie2", threads=2, maxAln=20, mm=False):
+    return (
+        [bowtie, "-f", "--end-to-end"]
+        + (["--mm"] if mm else [])
+        + ["-p " + str(threads), "-k " + str(maxAln), "-L 10", "-N 1", "-D 20", "-R 3"]
+        + ["-x", db, "-U", reads]
+    )
+
+
+"""runs aligner and filters SAM records as they are streamed from its output"""
+
+
+def streamAlignments(command, key, reads=None, tmThreshold=50.0, endMatch=6, maxAln=20):
+    proc = subprocess.Popen(
+        command, stdin=subprocess.PIPE if reads else subprocess.DEVNULL, stdout=subprocess.PIPE
+    )
+    if reads:
+        # feed reads from separate thread (avoids pipe deadlock)
+        def feed():
+            try:
+                proc.stdin.write(reads.encode())
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass  # aligner failed (reported by exit status)
+
+        writer = threading.Thread(target=feed, daemon=True)
+        writer.start()
+    try:
+        mappings = pysam.AlignmentFile(proc.stdout, "r")
+        placements = filterAlignments(mappings, key, tmThreshold, endMatch, maxAln)
+        mappings.close()
+    except BaseException:
+        # stop and reap aligner, report original error (exit status follows from closed pipe)
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+        if reads:
+            writer.join()
+        raise
+    proc.stdout.close()
+    if reads:
+        writer.join()
+    returncode = proc.wait()
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, command)
+    return placements
+
+
+"""genome aligner for a design run (one bowtie call per batch, placements cached by sequence)"""
+
+
+class Aligner(object):
+    def __init__(
+        self, db, bowtie="bowtie2", threads=2, tmThreshold=50.0, endMatch=6, maxAln=20
+    ):
+        self.db = db
+        self.bowtie = bowtie
+        self.threads = threads
+        self.tmThreshold = tmThreshold
+        self.endMatch = endMatch
+        self.maxAln = maxAln
+        self.placements = {}  # sequence -> [(chrom,pos,reverse,tm)]
+        self.calls = 0
+        self.preloaded = 0
+
+    def __repr__(self):
+        return "<Aligner {} ({} sequences placed in {} runs, {} known)>".format(
+            self.db, len(self.placements) - self.preloaded, self.calls, self.preloaded
+        )
+
+    def preload(self, placements):
+        # known placements (eg from database), skipped in alignment
+        for s, loci in placements.items():
+            if s not in self.placements:
+                self.placements[s] = loci
+                self.preloaded += 1
+
+    def search(self, seqs):
+        # single bowtie run (memory mapped index is shared between runs)
+        reads = "".join(">{}\n{}\n".format(i, s) for i, s in enumerate(seqs))
+        return streamAlignments(
+            bowtieCommand(self.db, "-", self.bowtie, self.threads, self.maxAln, mm=True),
+            lambda x: seqs[int(x)],
+            reads,
+            self.tmThreshold,
+            self.endMatch,
+            self.maxAln,
+        )
+
+    def align(self, seqs):
+        # align unseen sequences in a single batch
+        seqs = [s for s in OrderedDict.fromkeys(seqs) if s not in self.placements]
+        if not seqs:
+            return
+        placements = self.search(seqs)
+        self.calls += 1
+        for s in seqs:
+            self.placements[s] = placements.get(s, [])
+
+    def place(self, primers):
+        self.align([p.seq for p in primers])
+        for p in primers:
+            p.loci = []
+            for locus in self.placements[p.seq]:
+                p.addTarget(*locus)
+        return primers
+
+
 """Boundary exceeded exception (max list size)"""
 
 
@@ -293,6 +412,10 @@ class PrimerPair(list):
     def __hash__(self):
         return hash(self.__str__())
 
+    def __reduce__(self):
+        # pickle support (bound checks need attributes set before elements are restored)
+        return (self.__class__, (list(self), self.length), self.__dict__)
+
     def __eq__(self, other):
         return self.name == other.name
 
@@ -547,7 +670,7 @@ class Primer(object):
         self.name = name
         self.seq = str(seq.upper())
         self.tag = tag
-        self.tm = primer3.calcTm(self.seq)
+        self.tm = thermo.calcTm(self.seq)
         self.gc = (self.seq.count("G") + self.seq.count("C")) / float(len(self.seq))
         self.loci = []  # genome matches
         self.snp = []  # same order as loci attribute
@@ -610,56 +733,30 @@ class Primer(object):
         self.loci.append(Locus(chrom, pos, len(self), reverse, tm))
         return
 
-    def snpCheckPrimer(self, config, snpcheck_element_used=None):
+    def snpCheckPrimer(self, config, snpcheck_element_used=None, annotation=None, cache=None):
         accept = True
         if snpcheck_element_used is None:
             snpcheck_used = config["snpcheck"]["used"]
         else:
             snpcheck_used = snpcheck_element_used
         if isinstance(snpcheck_used, list):
-            snpccs = []
-            snpccs_all = None
-            for snpc in snpcheck_used:
-                acceptparticular = self.snpCheckPrimer(config, snpcheck_element_used=snpc)
-                accept = accept and acceptparticular
-                setsnpcc = set(self.snp)
-                if snpccs_all is None:
-                    snpccs_all = setsnpcc
-                else:
-                    news0 = setsnpcc - snpccs_all
-                    newsI = snpccs_all - setsnpcc
-                    #logger.info(f"nwqs0 {news0} {newsI} {len(snpccs)}")
-                    if len(snpccs) < 2:
-                        snpccs_all &= setsnpcc
-                    #if len(snpccs)==1:
-                    #    assert len(newsI)==0, (snpccs_all, newsI, snpcc, len(snpccs))
-                    #else:
-                    #    assert len(news0)==0, (snpccs_all, news0, newsI, snpcc, snpccs)
-                snpccs.append(self.snp)
-                #logger.info(f"snpccs_all turned {self} {snpccs_all} in {len(snpccs)}: {snpccs}")
-                #if len(snpcc) == 0:
-                #    self.snp = []
-                #    return False
-                #self.snp = list()
-            else:
-                self.snp = list(snpccs_all)
-                logger.info(f"elsed {accept} {self.targetposition!r} {self.snp}")
-                return accept
+            # all sources in one pass (cached per locus)
+            accept, self.snp = fusedSnpCheck(
+                config, snpcheck_used, self.targetposition, self.snp, annotation, cache
+            )
+            logger.info(f"elsed {accept} {self.targetposition!r} {self.snp}")
+            return accept
         else:
-            if isinstance(snpcheck_used, str) and snpcheck_used.startswith("gnomad:"):
-                snpcheck_used = float(snpcheck_used[7:])
-            if isinstance(snpcheck_used, str):
-                vcf = config["snpcheck"][snpcheck_used]
-                self.snp = self.targetposition.snpCheck(vcf)
+            source = snpSource(config, snpcheck_used, self.targetposition.chrom)
+            if source and source[1] is None:
+                self.snp = self.targetposition.snpCheck(source[0], annotation=annotation)
+            elif source:
+                (self.snp, gnomad_outliers) = self.targetposition.snpCheck(
+                    source[0], AF_cutoff=source[1], annotation=annotation
+                )
+                accept = len(gnomad_outliers) == 0
             else:
-
-                gnomadobj = gnomad.GnomadChromosomeInfo("2.1.1", "genomes", self.targetposition.chrom, "/var/local/zippy/resources")
-                if os.path.exists(gnomadobj.stripped_file_fullpath):
-                    (self.snp, gnomad_outliers) = self.targetposition.snpCheck(gnomadobj.stripped_file_fullpath, AF_cutoff=snpcheck_used)
-                    accept = len(gnomad_outliers) == 0
-                elif os.path.exists(gnomadobj.file_fullpath):
-                    (self.snp, gnomad_outliers) = self.targetposition.snpCheck(gnomadobj.file_fullpath, AF_cutoff=snpcheck_used)
-                    accept = len(gnomad_outliers) == 0
+                pass  # no gnomad file for chromosome
                 #assert accept, (accept, self.targetposition)
                 #else:
                 #    assert bool(self.snp), self.snp
@@ -714,14 +811,27 @@ class Locus(object):
     def __hash__(self):
         return hash((self.chrom, self.offset, self.length, self.reverse))
 
-    def snpCheck(self, database, AF_cutoff=None):
-        db = pysam.TabixFile(database)
+    def snpCheck(self, database, AF_cutoff=None, annotation=None):
+        # use batch annotation if available (see snpAnnotation)
+        try:
+            snps = annotation[(database, AF_cutoff)][self]
+        except (TypeError, KeyError):
+            pass
+        else:
+            return deepcopy(snps)
+        index = snpIndex(database)
+        if index:
+            return index.snpCheck(self, AF_cutoff)
+        db = tabixFile(database)
         try:
             snps = db.fetch(self.chrom, self.offset, self.offset + self.length)
         except ValueError:
             snps = []
         except:
             raise
+        return self.snpRecords(snps, AF_cutoff)
+
+    def snpRecords(self, snps, AF_cutoff=None):
         # query database and translate to primer positions
         #dirty = False
         snp_positions = []
@@ -758,6 +868,94 @@ class Locus(object):
             return (snp_positions, gnomad_outliers)
 
 
+"""SNPcheck of many loci with a sequential scan per merged region and chromosome"""
+
+
+def sweepSnps(database, loci, AF_cutoff=None, gap=1000):
+    index = snpIndex(database)
+    if index:  # binary search is faster
+        return {l: index.snpCheck(l, AF_cutoff) for l in loci}
+    db = tabixFile(database)
+    records = defaultdict(list)
+    bychrom = defaultdict(list)
+    for l in set(loci):
+        bychrom[l.chrom].append(l)
+    for chrom, chromloci in bychrom.items():
+        chromloci.sort(key=lambda x: (x.offset, x.length))
+        i = 0
+        while i < len(chromloci):
+            # merge nearby loci into one region
+            j, end = i, chromloci[i].offset + chromloci[i].length
+            while j + 1 < len(chromloci) and chromloci[j + 1].offset <= end + gap:
+                j += 1
+                end = max(end, chromloci[j].offset + chromloci[j].length)
+            region, i = chromloci[i : j + 1], j + 1
+            maxlength = max(l.length for l in region)
+            try:
+                snps = db.fetch(chrom, region[0].offset, end)
+            except ValueError:
+                snps = []
+            # sweep records (sorted by start) over loci (sorted by offset)
+            first = 0
+            for v in snps:
+                f = v.split("\t", 8)
+                start = int(f[1]) - 1
+                stop = vcfEnd(f, start)
+                while first < len(region) and region[first].offset + maxlength <= start:
+                    first += 1
+                for l in region[first:]:
+                    if l.offset >= stop:
+                        break
+                    if l.offset + l.length > start:
+                        records[l].append(v)
+    return {l: l.snpRecords(records[l], AF_cutoff) for l in loci}
+
+
+"""batch SNPcheck annotation of loci for all configured sources ((database, AF_cutoff) -> locus -> SNPs)"""
+
+
+def snpAnnotation(config, loci):
+    used = config["snpcheck"]["used"]
+    sources = defaultdict(set)
+    for l in loci:
+        for snpc in used if isinstance(used, list) else [used]:
+            source = snpSource(config, snpc, l.chrom)
+            if source:
+                sources[source].add(l)
+    return {source: sweepSnps(source[0], l, source[1]) for source, l in sources.items()}
+
+
+"""combined SNPcheck of locus over several sources (accept if all accept, SNPs of first two intersected)"""
+
+
+def fusedSnpCheck(config, used, locus, snps=(), annotation=None, cache=None):
+    key = (tuple(used), locus)
+    try:
+        accept, combined = cache[key]
+    except (TypeError, KeyError):
+        pass
+    else:
+        return accept, list(combined)
+    accept, combined, cacheable = True, None, True
+    for i, snpc in enumerate(used):
+        source = snpSource(config, snpc, locus.chrom)
+        if source and source[1] is None:
+            snps = locus.snpCheck(source[0], annotation=annotation)
+        elif source:
+            snps, outliers = locus.snpCheck(source[0], AF_cutoff=source[1], annotation=annotation)
+            accept = accept and len(outliers) == 0
+        elif i == 0:
+            cacheable = False  # keeps SNPs of previous check
+        if combined is None:
+            combined = set(snps)
+        elif i == 1:
+            combined &= set(snps)
+    combined = list(combined if combined is not None else snps)
+    if cache is not None and cacheable:
+        cache[key] = (accept, combined)
+    return accept, list(combined)
+
+
 """primer3 wrapper class"""
 
 
@@ -769,7 +967,7 @@ class Primer3(object):
         self.genome = genome
         self.target = target
         self.flank = flank
-        fasta = pysam.FastaFile(self.genome)
+        fasta = fastaFile(self.genome)
         lowerlimit = max(0, target[1] - self.flank)
         upperlimit = max(0, target[2] + self.flank)
         strselftarget0 = str(target[0])
@@ -820,11 +1018,12 @@ class Primer3(object):
             )
         self.pairs = []
         self.explain = []
+        self.cached = False
 
     def __len__(self):
         return len(self.pairs)
 
-    def design(self, name, pars):
+    def design(self, name, pars, cache=None):
         # Sequence args
         seq = {
             "SEQUENCE_ID": str(name),
@@ -836,8 +1035,18 @@ class Primer3(object):
                 self.flank,
             ],
         }
-        # design primers
-        primers = primer3.bindings.designPrimers(seq, pars)
+        # design primers (or reuse cached design of identical template and settings)
+        self.cached = False
+        if cache:
+            key = cache.key(
+                seq["SEQUENCE_TEMPLATE"], seq["SEQUENCE_PRIMER_PAIR_OK_REGION_LIST"], pars
+            )
+            primers = cache.get(key)
+            self.cached = primers is not None
+        if not self.cached:
+            primers = primer3.bindings.designPrimers(seq, pars)
+            if cache:
+                cache.put(key, primers)
         # parse primer
         primerdata, explain = defaultdict(dict), []
         for k, v in primers.items():
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+__doc__ == """Memory mapped SNP/allele frequency index of snpcheck sources"""
+__author__ = "David Brawand"
+__license__ = "MIT"
+__maintainer__ = "David Brawand"
+__email__ = "dbrawand@nhs.net"
+__status__ = "Production"
+
+import os
+import sys
+import json
+import array
+import argparse
+import numpy as np
+import pysam
+from . import gnomad
+
+INDEXVERSION = 2  # increment when index format or record spans change
+FIELDS = ["start", "end", "length", "af", "idoffset"]
+indexes = {}  # path -> (source stamp, SnpIndex or None)
+
+
+def indexPath(database):
+    return database + ".snpidx"
+
+
+def sourceStamp(database):
+    st = os.stat(database)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def chromFile(path, chrom, field):
+    return os.path.join(path, "{}.{}.npy".format(chrom, field))
+
+
+"""end of VCF record as used by tabix (REF span or INFO END, whichever is larger)"""
+
+
+def vcfEnd(f, start):
+    end = start + len(f[3])
+    for field in f[7].split(";"):
+        if field.startswith("END="):
+            try:
+                end = max(end, int(field[4:]))
+            except ValueError:
+                pass
+            break
+    return end
+
+
+def vcfAF(info):
+    for field in info.split(";"):
+        if field.startswith("AF="):
+            try:
+                return float(field[3:])
+            except ValueError:
+                break
+    return float("nan")
+
+
+"""converts tabix indexed VCF to per chromosome arrays (start,end,max allele length,AF,ids)"""
+
+
+def buildIndex(database):
+    path = indexPath(database)
+    os.makedirs(path, exist_ok=True)
+    stamp = sourceStamp(database)
+    tabix = pysam.TabixFile(database)
+    chroms = {}
+    for chrom in tabix.contigs:
+        columns = {
+            "start": array.array("q"),
+            "end": array.array("q"),
+            "length": array.array("q"),
+            "af": array.array("d"),
+        }
+        ids, idoffsets = bytearray(), array.array("q", [0])
+        for v in tabix.fetch(chrom):
+            f = v.split("\t", 8)
+            start = int(f[1]) - 1
+            columns["start"].append(start)
+            columns["end"].append(vcfEnd(f, start))
+            columns["length"].append(max(map(len, [f[3]] + f[4].split(","))))
+            columns["af"].append(vcfAF(f[7]))
+            ids += f[2].encode()
+            idoffsets.append(len(ids))
+        columns = {k: np.frombuffer(v, dtype=v.typecode) for k, v in columns.items()}
+        columns["idoffset"] = np.frombuffer(idoffsets, dtype=np.int64)
+        for field, values in columns.items():
+            np.save(chromFile(path, chrom, field), values)
+        with open(os.path.join(path, "{}.ids".format(chrom)), "wb") as fh:
+            fh.write(ids)
+        chroms[chrom] = {
+            "records": len(columns["start"]),
+            "maxspan": int((columns["end"] - columns["start"]).max(initial=0)),
+        }
+        print("Indexed {} ({} records)".format(chrom, chroms[chrom]["records"]), file=sys.stderr)
+    tabix.close()
+    with open(os.path.join(path, "index.json"), "w") as fh:
+        json.dump(
+            {"version": INDEXVERSION, "source": database, "stamp": stamp, "chroms": chroms},
+            fh,
+            indent=4,
+        )
+    indexes.pop(database, None)
+    return SnpIndex(database)
+
+
+"""memory mapped SNP index (binary search of overlapping records)"""
+
+
+class SnpIndex(object):
+    def __init__(self, database):
+        self.database = database
+        self.path = indexPath(database)
+        with open(os.path.join(self.path, "index.json")) as fh:
+            meta = json.load(fh)
+        if meta["version"] != INDEXVERSION:
+            raise Exception("SnpIndexVersionError")
+        self.stamp = meta["stamp"]
+        self.chroms = meta["chroms"]
+        self.arrays = {}
+
+    def __repr__(self):
+        return "<SnpIndex {} ({} chromosomes)>".format(self.database, len(self.chroms))
+
+    def chrom(self, chrom):
+        try:
+            return self.arrays[chrom]
+        except KeyError:
+            columns = {
+                field: np.load(chromFile(self.path, chrom, field), mmap_mode="r")
+                for field in FIELDS
+            }
+            ids = os.path.join(self.path, "{}.ids".format(chrom))
+            columns["ids"] = np.memmap(ids, dtype=np.uint8, mode="r") if os.path.getsize(ids) else b""
+            self.arrays[chrom] = columns
+            return columns
+
+    def fetch(self, chrom, start, end):
+        # returns record indices overlapping interval (in file order)
+        if chrom not in self.chroms or not self.chroms[chrom]["records"]:
+            return None, []
+        c = self.chrom(chrom)
+        i = np.searchsorted(c["start"], start - self.chroms[chrom]["maxspan"], side="left")
+        j = np.searchsorted(c["start"], end, side="left")
+        return c, np.arange(i, j)[c["end"][i:j] > start]
+
+    def snpCheck(self, locus, AF_cutoff=None):
+        # same result as Locus.snpCheck on the VCF file
+        c, hits = self.fetch(locus.chrom, locus.offset, locus.offset + locus.length)
+        snp_positions, gnomad_outliers = [], []
+        for k in hits:
+            snp_tuple = (
+                locus.chrom,
+                int(c["start"][k]) - locus.offset,
+                int(c["length"][k]),
+                bytes(c["ids"][c["idoffset"][k] : c["idoffset"][k + 1]]).decode(),
+            )
+            snp_positions.append(snp_tuple)
+            if AF_cutoff is not None:
+                assert not np.isnan(c["af"][k])
+                if c["af"][k] > AF_cutoff / 100.0:
+                    gnomad_outliers.append(snp_tuple)  # tags high frequency mutation
+        return snp_positions if AF_cutoff is None else (snp_positions, gnomad_outliers)
+
+
+"""returns SNP index of database if built and current (None otherwise)"""
+
+
+def snpIndex(database):
+    try:
+        stamp = sourceStamp(database)
+        if indexes[database][0] == stamp:
+            return indexes[database][1]
+    except (OSError, KeyError):
+        pass
+    index = None
+    if os.path.exists(os.path.join(indexPath(database), "index.json")):
+        try:
+            index = SnpIndex(database)
+        except Exception as exc:
+            print("WARNING: cannot read SNP index of {} ({})".format(database, exc), file=sys.stderr)
+        else:
+            if index.stamp != sourceStamp(database):
+                print("WARNING: SNP index of {} is outdated".format(database), file=sys.stderr)
+                index = None
+    try:
+        indexes[database] = (sourceStamp(database), index)
+    except OSError:
+        pass
+    return index
+
+
+"""resolves snpcheck source to (database, AF_cutoff) for chromosome (None if not available)"""
+
+
+def snpSource(config, snpcheck_used, chrom):
+    if isinstance(snpcheck_used, str) and snpcheck_used.startswith("gnomad:"):
+        snpcheck_used = float(snpcheck_used[7:])
+    if isinstance(snpcheck_used, str):
+        return (config["snpcheck"][snpcheck_used], None)
+    gnomadobj = gnomad.GnomadChromosomeInfo("2.1.1", "genomes", chrom, "/var/local/zippy/resources")
+    if os.path.exists(gnomadobj.stripped_file_fullpath):
+        return (gnomadobj.stripped_file_fullpath, snpcheck_used)
+    elif os.path.exists(gnomadobj.file_fullpath):
+        return (gnomadobj.file_fullpath, snpcheck_used)
+    return None
+
+
+"""configured snpcheck sources (VCF files and available gnomAD chromosome files)"""
+
+
+def configuredSources(config):
+    used = config["snpcheck"]["used"]
+    sources = []
+    for snpc in used if isinstance(used, list) else [used]:
+        for chrom in list(map(str, range(1, 23))) + ["X", "Y"]:
+            source = snpSource(config, snpc, chrom)
+            if source:
+                sources.append(source[0])
+    return list(dict.fromkeys(sources))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds SNP indexes of snpcheck sources")
+    parser.add_argument("sources", nargs="*", help="VCF files [configured snpcheck sources]")
+    parser.add_argument(
+        "-c", dest="config", default=os.path.join(os.path.dirname(__file__), "..", "zippy.json")
+    )
+    args = parser.parse_args()
+    if not args.sources:
+        with open(args.config) as fh:
+            args.sources = configuredSources(json.load(fh))
+    for source in args.sources:
+        print(buildIndex(source), file=sys.stderr)
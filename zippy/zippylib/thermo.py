@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+__doc__ == """Memoized primer3 melting temperature calculations"""
+__author__ = "David Brawand"
+__license__ = "MIT"
+__maintainer__ = "David Brawand"
+__email__ = "dbrawand@nhs.net"
+__status__ = "Production"
+
+import primer3
+from functools import lru_cache
+
+CACHESIZE = 2 ** 16
+memos = {}
+
+
+"""(re)creates bounded LRU memos (process wide, kept across design rounds)"""
+
+
+def configure(size=CACHESIZE):
+    if memos and all(m.cache_info().maxsize == size for m in memos.values()):
+        return  # keep warm caches
+    memos["tm"] = lru_cache(maxsize=size)(primer3.calcTm)
+    memos["heterodimer"] = lru_cache(maxsize=size)(primer3.calcHeterodimerTm)
+
+
+def calcTm(seq):
+    return memos["tm"](seq)
+
+
+def calcHeterodimerTm(seq1, seq2):
+    return memos["heterodimer"](seq1, seq2)
+
+
+"""memo statistics (calls, hits, hit rate, size)"""
+
+
+def stats():
+    result = {}
+    for name, memo in memos.items():
+        info = memo.cache_info()
+        calls = info.hits + info.misses
+        result[name] = {
+            "calls": calls,
+            "hits": info.hits,
+            "hitrate": info.hits / float(calls) if calls else 0.0,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+        }
+    return result
+
+
+def report():
+    return "\n".join(
+        "{:<12} {:>10} calls {:>6.1%} hits ({}/{} cached)".format(
+            name, s["calls"], s["hitrate"], s["size"], s["maxsize"]
+        )
+        for name, s in stats().items()
+        if s["calls"]
+    )
+
+
+configure()